@@ -1,3 +1,9 @@
 from django.contrib import admin
 
-# Register your models here.
+from bot.models import Workplace
+
+
+@admin.register(Workplace)
+class WorkplaceAdmin(admin.ModelAdmin):
+    list_display = ('name', 'latitude', 'longitude', 'radius')
+    filter_horizontal = ('departments',)
@@ -0,0 +1,83 @@
+import datetime
+import typing
+
+from django.utils import timezone
+
+from bot.models import ActionLog, DailyAttendance, UserStatus
+
+
+def minutes_between(start: datetime.datetime, end: datetime.datetime) -> int:
+    return max(int((end - start).total_seconds() // 60), 0)
+
+
+def apply_status(
+    attendance: DailyAttendance,
+    status: UserStatus,
+    created: datetime.datetime,
+    begin_at: typing.Optional[datetime.time] = None,
+):
+    if status in (UserStatus.BEGIN_LANCH, UserStatus.END) and attendance.worked_since:
+        attendance.minutes_worked += minutes_between(attendance.worked_since, created)
+        attendance.worked_since = None
+    if status is UserStatus.BEGIN:
+        if attendance.begin is None:
+            attendance.begin = created
+            if begin_at is not None:
+                scheduled = timezone.make_aware(datetime.datetime.combine(attendance.date, begin_at))
+                attendance.minutes_late = minutes_between(scheduled, created)
+        attendance.worked_since = created
+    elif status is UserStatus.BEGIN_LANCH:
+        attendance.begin_lanch = created
+    elif status is UserStatus.END_LANCH:
+        attendance.end_lanch = created
+        attendance.worked_since = created
+    elif status is UserStatus.END:
+        attendance.end = created
+
+
+def record_attendance(action: ActionLog, department=None) -> DailyAttendance:
+    attendance, _ = DailyAttendance.objects.select_for_update().get_or_create(
+        user_id=action.user_id, date=timezone.localdate(action.created)
+    )
+    apply_status(attendance, UserStatus(action.status_new), action.created, department.begin if department else None)
+    attendance.save()
+    return attendance
+
+
+def status_alert(user, department, action: ActionLog) -> typing.Optional[str]:
+    if not department:
+        return None
+    action_created = timezone.localtime(action.created)
+    at = action_created.time()
+    new_status = UserStatus(action.status_new)
+    # departments created from the bot start without a schedule, so every rule checks its own fields
+    if new_status is UserStatus.BEGIN and department.begin and at > department.begin:
+        return f'Сотрудник {user.name} {department.name} прибыл на рабочее место {at.strftime("%X")}'
+    if (
+        new_status is UserStatus.BEGIN_LANCH
+        and department.begin_lanch and department.end_lanch
+        and not department.begin_lanch <= at <= department.end_lanch
+    ):
+        return f'Сотрудник {user.name} {department.name} ушел на обед {at.strftime("%X")}'
+    if new_status is UserStatus.END_LANCH and department.end_lanch and at > department.end_lanch:
+        return f'Сотрудник {user.name} {department.name} вернулся с обеда {at.strftime("%X")}'
+    if new_status is UserStatus.END and department.end and at < department.end:
+        return f'Сотрудник {user.name} {department.name} ушел с работы до окончания рабочего дня {at.strftime("%X")}'
+    return None
+
+
+def format_attendance(attendance: DailyAttendance) -> str:
+    def at(value):
+        return timezone.localtime(value).strftime('%H:%M') if value else '—'
+
+    lines = [attendance.date.strftime('%d.%m.%Y')]
+    begin = f'Приход: {at(attendance.begin)}'
+    if attendance.minutes_late:
+        begin += f' (опоздание {attendance.minutes_late} мин)'
+    lines.append(begin)
+    if attendance.begin_lanch or attendance.end_lanch:
+        lines.append(f'Обед: {at(attendance.begin_lanch)} - {at(attendance.end_lanch)}')
+    lines.append(f'Уход: {at(attendance.end)}')
+    hours, minutes = divmod(attendance.minutes_worked, 60)
+    lines.append(f'Отработано: {hours} ч {minutes} мин')
+    return '\n'.join(lines)
@@ -0,0 +1,81 @@
+import time
+import typing
+from collections import OrderedDict
+
+from bot.queries import UserSnapshot
+
+
+class TTLCache:
+    def __init__(self, maxsize: int = 10000, ttl: float = 300, on_evict=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.on_evict = on_evict
+        self._data: typing.OrderedDict[typing.Hashable, typing.Tuple[float, typing.Any]] = OrderedDict()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def get(self, key, default=None):
+        item = self._data.get(key)
+        if item is None:
+            return default
+        expires, value = item
+        if expires < time.monotonic():
+            self.pop(key)
+            return default
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key, value, ttl: typing.Optional[float] = None):
+        self._data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            evicted, (_, evicted_value) = self._data.popitem(last=False)
+            if self.on_evict:
+                self.on_evict(evicted, evicted_value)
+
+    def pop(self, key, default=None):
+        item = self._data.pop(key, None)
+        if item is None:
+            return default
+        if self.on_evict:
+            self.on_evict(key, item[1])
+        return item[1]
+
+    def clear(self):
+        for key in list(self._data):
+            self.pop(key)
+
+
+class UserCache:
+    def __init__(self, maxsize: int = 10000, ttl: float = 300):
+        self._users = TTLCache(maxsize, ttl, on_evict=self._forget)
+        self._tg_ids: typing.Dict[int, int] = {}
+
+    def _forget(self, tg_id, user: UserSnapshot):
+        if self._tg_ids.get(user.id) == tg_id:
+            del self._tg_ids[user.id]
+
+    def get(self, tg_id: int) -> typing.Optional[UserSnapshot]:
+        return self._users.get(tg_id)
+
+    def put(self, user: UserSnapshot):
+        self._users.set(user.tg_id, user)
+        self._tg_ids[user.id] = user.tg_id
+
+    def update(self, user_id: int, **fields):
+        tg_id = self._tg_ids.get(user_id)
+        user = self._users.get(tg_id) if tg_id is not None else None
+        if user is not None:
+            self.put(user._replace(**fields))
+
+    def invalidate(self, user_id: int):
+        tg_id = self._tg_ids.get(user_id)
+        if tg_id is not None:
+            self._users.pop(tg_id)
+
+    def clear(self):
+        self._users.clear()
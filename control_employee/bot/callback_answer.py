@@ -0,0 +1,19 @@
+import logging
+
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import CallbackQuery
+from aiogram.utils.callback_answer import CallbackAnswer, CallbackAnswerMiddleware
+
+logger = logging.getLogger(__name__)
+
+
+class EarlyCallbackAnswerMiddleware(CallbackAnswerMiddleware):
+    def __init__(self, **kwargs):
+        kwargs.setdefault('pre', True)
+        super().__init__(**kwargs)
+
+    async def answer(self, event: CallbackQuery, callback_answer: CallbackAnswer):
+        try:
+            return await super().answer(event, callback_answer)
+        except TelegramBadRequest as e:
+            logger.debug('Failed to answer callback query %s: %s', event.id, e)
@@ -0,0 +1,37 @@
+import functools
+import typing
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections, transaction
+
+
+def db_unit(func):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        close_old_connections()
+        try:
+            with transaction.atomic():
+                return func(*args, **kwargs)
+        finally:
+            close_old_connections()
+    return sync_to_async(wrapper, thread_sensitive=False)
+
+
+@sync_to_async
+def close_connections():
+    close_old_connections()
+
+
+class ConnectionMiddleware(BaseMiddleware):
+    async def __call__(
+        self,
+        handler: typing.Callable[[TelegramObject, typing.Dict[str, typing.Any]], typing.Awaitable[typing.Any]],
+        event: TelegramObject,
+        data: typing.Dict[str, typing.Any],
+    ) -> typing.Any:
+        try:
+            return await handler(event, data)
+        finally:
+            await close_connections()
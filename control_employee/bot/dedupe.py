@@ -0,0 +1,97 @@
+import datetime
+import logging
+import time
+import typing
+
+from aiogram import BaseMiddleware
+from aiogram.exceptions import TelegramAPIError
+from aiogram.types import TelegramObject, Update
+from django.db import connection
+from django.utils import timezone
+
+from bot.cache import TTLCache
+from bot.db import db_unit
+from bot.models import ProcessedUpdate
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryDedupeStore:
+    def __init__(self, maxsize: int = 100000):
+        self._keys = TTLCache(maxsize)
+
+    async def seen(self, keys: typing.Dict[str, float]) -> bool:
+        duplicate = False
+        for key, ttl in keys.items():
+            if key in self._keys:
+                duplicate = True
+            else:
+                self._keys.set(key, True, ttl)
+        return duplicate
+
+
+class PostgresDedupeStore:
+    def __init__(self, cleanup_interval: float = 60):
+        self.cleanup_interval = cleanup_interval
+        self._cleaned_at = time.monotonic()
+
+    @staticmethod
+    @db_unit
+    def _claim(keys: typing.Dict[str, float], cleanup: bool) -> bool:
+        now = timezone.now()
+        table = ProcessedUpdate._meta.db_table
+        params = []
+        for key, ttl in keys.items():
+            params.extend((key, now + datetime.timedelta(seconds=ttl)))
+        values = ', '.join(['(%s, %s)'] * len(keys))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {table} (key, expires) VALUES {values} '
+                f'ON CONFLICT (key) DO UPDATE SET expires = EXCLUDED.expires WHERE {table}.expires < %s '
+                f'RETURNING key',
+                [*params, now],
+            )
+            claimed = cursor.fetchall()
+        if cleanup:
+            ProcessedUpdate.objects.filter(expires__lt=now).delete()
+        return len(claimed) < len(keys)
+
+    async def seen(self, keys: typing.Dict[str, float]) -> bool:
+        cleanup = time.monotonic() - self._cleaned_at > self.cleanup_interval
+        if cleanup:
+            self._cleaned_at = time.monotonic()
+        return await self._claim(keys, cleanup)
+
+
+class DedupeMiddleware(BaseMiddleware):
+    def __init__(self, store, window: float = 600, tap_window: float = 1.5):
+        self.store = store
+        self.window = window
+        self.tap_window = tap_window
+
+    def keys(self, update: Update) -> typing.Dict[str, float]:
+        keys = {f'update:{update.update_id}': self.window}
+        callback_query = update.callback_query
+        if callback_query:
+            keys[f'callback:{callback_query.id}'] = self.window
+            if self.tap_window and callback_query.message:
+                keys[
+                    f'tap:{callback_query.from_user.id}:{callback_query.message.message_id}:{callback_query.data}'
+                ] = self.tap_window
+        return keys
+
+    async def __call__(
+        self,
+        handler: typing.Callable[[TelegramObject, typing.Dict[str, typing.Any]], typing.Awaitable[typing.Any]],
+        event: TelegramObject,
+        data: typing.Dict[str, typing.Any],
+    ) -> typing.Any:
+        if not isinstance(event, Update) or not await self.store.seen(self.keys(event)):
+            return await handler(event, data)
+        logger.debug('Skipping duplicate update %s', event.update_id)
+        if event.callback_query:
+            try:
+                await event.callback_query.answer()
+            except TelegramAPIError:
+                pass
+        return None
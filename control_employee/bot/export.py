@@ -0,0 +1,83 @@
+import csv
+import datetime
+import gzip
+import io
+import tempfile
+import typing
+
+from aiogram import Bot
+from aiogram.types import InputFile
+from django.utils import timezone
+
+from bot.db import db_unit
+from bot.models import ActionLog, UserStatus, display_name
+from bot.queries import local_date_range
+
+EXPORT_CHUNK_SIZE = 2000
+EXPORT_SPOOL_SIZE = 1024 * 1024
+EXPORT_HEADER = ['Дата', 'Время', 'Сотрудник', 'Telegram ID', 'Подразделение', 'Статус до', 'Статус']
+
+
+class SpooledInputFile(InputFile):
+    def __init__(self, file: typing.BinaryIO, filename: str, chunk_size: int = 64 * 1024):
+        super().__init__(filename=filename, chunk_size=chunk_size)
+        self.file = file
+
+    async def read(self, bot: Bot) -> typing.AsyncGenerator[bytes, None]:
+        self.file.seek(0)
+        while chunk := self.file.read(self.chunk_size):
+            yield chunk
+
+
+STATUS_LABELS = dict(UserStatus.choices)
+
+
+@db_unit
+def export_action_log(
+    from_date: datetime.date,
+    to_date: datetime.date,
+    department_id: typing.Optional[int] = None,
+    user_id: typing.Optional[int] = None,
+) -> typing.Tuple[tempfile.SpooledTemporaryFile, int]:
+    start, end = local_date_range(from_date, to_date)
+    qs = ActionLog.objects.filter(created__gte=start, created__lt=end)
+    if department_id is not None:
+        qs = qs.filter(user__department_id=department_id)
+    if user_id is not None:
+        qs = qs.filter(user_id=user_id)
+    rows = qs.order_by('created', 'id').values_list(
+        'created',
+        'user__last_name',
+        'user__first_name',
+        'user__username',
+        'user__tg_id',
+        'user__department__name',
+        'status_before',
+        'status_new',
+    )
+    tz = timezone.get_default_timezone()
+    spool = tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_SIZE)
+    count = 0
+    with gzip.GzipFile(fileobj=spool, mode='wb') as archive:
+        text = io.TextIOWrapper(archive, encoding='utf-8-sig', newline='')
+        writer = csv.writer(text, delimiter=';')
+        writer.writerow(EXPORT_HEADER)
+        # iterator() streams through a server-side cursor inside the db_unit transaction
+        for created, last_name, first_name, username, tg_id, department, before, new in rows.iterator(
+            chunk_size=EXPORT_CHUNK_SIZE
+        ):
+            date, time = created.astimezone(tz).strftime('%d.%m.%Y %H:%M:%S').split(' ')
+            writer.writerow([
+                date,
+                time,
+                display_name(last_name, first_name, username).strip(),
+                tg_id,
+                department or '',
+                STATUS_LABELS.get(before, before),
+                STATUS_LABELS.get(new, new),
+            ])
+            count += 1
+        text.flush()
+        text.detach()
+    spool.seek(0)
+    return spool, count
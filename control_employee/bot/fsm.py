@@ -0,0 +1,145 @@
+import asyncio
+import datetime
+import logging
+import typing
+import uuid
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, KeyBuilder, StateType, StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+
+from bot.cache import TTLCache
+from bot.db import db_unit
+from bot.models import FsmState
+from bot.registry import listen
+
+logger = logging.getLogger(__name__)
+
+CLEANUP_BATCH_SIZE = 1000
+
+
+class StoredState(typing.NamedTuple):
+    state: typing.Optional[str]
+    data: typing.Dict[str, typing.Any]
+
+
+EMPTY = StoredState(None, {})
+
+
+class PostgresStorage(BaseStorage):
+    channel = 'fsm_changed'
+
+    def __init__(
+        self,
+        state_ttl: float = 86400,
+        cache_size: int = 10000,
+        cache_ttl: float = 3600,
+        key_builder: typing.Optional[KeyBuilder] = None,
+    ):
+        self.state_ttl = state_ttl
+        self.key_builder = key_builder or DefaultKeyBuilder(with_destiny=True, with_business_connection_id=True)
+        self.instance = uuid.uuid4().hex
+        self._cache = TTLCache(cache_size, cache_ttl)
+
+    def _expired_before(self) -> datetime.datetime:
+        return timezone.now() - datetime.timedelta(seconds=self.state_ttl)
+
+    @db_unit
+    def _load(self, key: str) -> StoredState:
+        row = FsmState.objects.filter(key=key, updated__gte=self._expired_before()).first()
+        return StoredState(row.state, row.data) if row else EMPTY
+
+    @db_unit
+    def _save(self, key: str, stored: StoredState):
+        if stored.state is None and not stored.data:
+            FsmState.objects.filter(key=key).delete()
+        else:
+            FsmState.objects.update_or_create(key=key, defaults={'state': stored.state, 'data': stored.data})
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_notify(%s, %s)', [self.channel, f'{self.instance}:{key}'])
+
+    async def _get(self, key: StorageKey) -> typing.Tuple[str, StoredState]:
+        storage_key = self.key_builder.build(key)
+        stored = self._cache.get(storage_key)
+        if stored is None:
+            stored = await self._load(storage_key)
+            self._cache.set(storage_key, stored)
+        return storage_key, stored
+
+    async def _set(self, storage_key: str, stored: StoredState):
+        await self._save(storage_key, stored)
+        self._cache.set(storage_key, stored)
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        storage_key, stored = await self._get(key)
+        state = state.state if isinstance(state, State) else state
+        await self._set(storage_key, stored._replace(state=state))
+
+    async def get_state(self, key: StorageKey) -> typing.Optional[str]:
+        _, stored = await self._get(key)
+        return stored.state
+
+    async def set_data(self, key: StorageKey, data: typing.Mapping[str, typing.Any]) -> None:
+        storage_key, stored = await self._get(key)
+        await self._set(storage_key, stored._replace(data=dict(data)))
+
+    async def get_data(self, key: StorageKey) -> typing.Dict[str, typing.Any]:
+        _, stored = await self._get(key)
+        return dict(stored.data)
+
+    async def close(self) -> None:
+        self._cache.clear()
+
+    async def _handle(self, payload: str):
+        instance, _, storage_key = payload.partition(':')
+        if instance != self.instance:
+            self._cache.pop(storage_key)
+
+    async def _reset(self):
+        self._cache.clear()
+
+    async def listen(self):
+        await listen(self.channel, self._handle, on_connect=self._reset)
+
+    @db_unit
+    def _delete_expired(self, limit: int) -> int:
+        keys = list(FsmState.objects.filter(updated__lt=self._expired_before()).values_list('key', flat=True)[:limit])
+        return FsmState.objects.filter(key__in=keys).delete()[0] if keys else 0
+
+    async def cleanup(self) -> int:
+        deleted = 0
+        while True:
+            batch = await self._delete_expired(CLEANUP_BATCH_SIZE)
+            deleted += batch
+            if batch < CLEANUP_BATCH_SIZE:
+                return deleted
+
+    async def _cleanup_periodically(self, interval: float):
+        while True:
+            try:
+                deleted = await self.cleanup()
+                if deleted:
+                    logger.info('Deleted %s abandoned FSM states', deleted)
+            except Exception:
+                logger.exception('Failed to clean up FSM states')
+            await asyncio.sleep(interval)
+
+    async def run(self, cleanup_interval: float = 3600):
+        await asyncio.gather(self.listen(), self._cleanup_periodically(cleanup_interval))
+
+
+def create_storage() -> BaseStorage:
+    if settings.FSM_STORAGE == 'memory':
+        return MemoryStorage()
+    if settings.FSM_STORAGE == 'redis':
+        from aiogram.fsm.storage.redis import RedisStorage
+        return RedisStorage.from_url(
+            settings.FSM_REDIS_URL,
+            key_builder=DefaultKeyBuilder(with_destiny=True, with_business_connection_id=True),
+            state_ttl=settings.FSM_STATE_TTL,
+            data_ttl=settings.FSM_STATE_TTL,
+        )
+    return PostgresStorage(state_ttl=settings.FSM_STATE_TTL)
@@ -0,0 +1,104 @@
+import math
+import typing
+
+from asgiref.sync import sync_to_async
+from geopy.distance import geodesic
+
+from bot.models import Workplace
+from bot.registry import listen
+
+EARTH_RADIUS_M = 6371008.8
+METERS_PER_DEGREE = math.pi * EARTH_RADIUS_M / 180
+PREFILTER_MARGIN = 0.01
+
+
+class WorkplaceSnapshot(typing.NamedTuple):
+    id: typing.Optional[int]
+    name: str
+    latitude: float
+    longitude: float
+    radius: float
+    department_ids: typing.FrozenSet[int] = frozenset()
+
+    @classmethod
+    def from_model(cls, workplace: Workplace):
+        return cls(
+            workplace.id,
+            workplace.name,
+            workplace.latitude,
+            workplace.longitude,
+            workplace.radius,
+            frozenset(department.id for department in workplace.departments.all()),
+        )
+
+
+def equirectangular(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    x = math.radians(lon2 - lon1) * math.cos(math.radians((lat1 + lat2) / 2))
+    y = math.radians(lat2 - lat1)
+    return EARTH_RADIUS_M * math.hypot(x, y)
+
+
+def within(workplace: WorkplaceSnapshot, latitude: float, longitude: float) -> bool:
+    distance = equirectangular(workplace.latitude, workplace.longitude, latitude, longitude)
+    if distance <= workplace.radius * (1 - PREFILTER_MARGIN):
+        return True
+    if distance > workplace.radius * (1 + PREFILTER_MARGIN):
+        return False
+    return geodesic((workplace.latitude, workplace.longitude), (latitude, longitude)).m <= workplace.radius
+
+
+class GeofenceIndex:
+    channel = 'workplace_changed'
+
+    def __init__(self, cell_size: float = 0.01, fallback: typing.Optional[WorkplaceSnapshot] = None):
+        self.cell_size = cell_size
+        self.fallback = fallback
+        self._workplaces: typing.List[WorkplaceSnapshot] = []
+        self._cells: typing.Dict[typing.Tuple[int, int], typing.List[WorkplaceSnapshot]] = {}
+
+    def _cell(self, latitude: float, longitude: float) -> typing.Tuple[int, int]:
+        return math.floor(latitude / self.cell_size), math.floor(longitude / self.cell_size)
+
+    def build(self, workplaces: typing.Iterable[WorkplaceSnapshot]):
+        workplaces = list(workplaces)
+        cells = {}
+        for workplace in workplaces:
+            reach = workplace.radius * (1 + PREFILTER_MARGIN) / METERS_PER_DEGREE
+            lon_reach = reach / max(math.cos(math.radians(workplace.latitude)), 1e-6)
+            lat_from, lon_from = self._cell(workplace.latitude - reach, workplace.longitude - lon_reach)
+            lat_to, lon_to = self._cell(workplace.latitude + reach, workplace.longitude + lon_reach)
+            for lat_cell in range(lat_from, lat_to + 1):
+                for lon_cell in range(lon_from, lon_to + 1):
+                    cells.setdefault((lat_cell, lon_cell), []).append(workplace)
+        self._workplaces = workplaces
+        self._cells = cells
+
+    def candidates(self, latitude: float, longitude: float) -> typing.List[WorkplaceSnapshot]:
+        if not self._workplaces:
+            return [self.fallback] if self.fallback else []
+        return self._cells.get(self._cell(latitude, longitude), [])
+
+    def find(
+        self, latitude: float, longitude: float, department_id: typing.Optional[int] = None
+    ) -> typing.Optional[WorkplaceSnapshot]:
+        for workplace in self.candidates(latitude, longitude):
+            if workplace.department_ids and department_id not in workplace.department_ids:
+                continue
+            if within(workplace, latitude, longitude):
+                return workplace
+        return None
+
+    @staticmethod
+    @sync_to_async
+    def _load():
+        workplaces = Workplace.objects.prefetch_related('departments')
+        return [WorkplaceSnapshot.from_model(workplace) for workplace in workplaces]
+
+    async def load(self):
+        self.build(await self._load())
+
+    async def _handle(self, payload: str):
+        await self.load()
+
+    async def listen(self):
+        await listen(self.channel, self._handle, on_connect=self.load)
@@ -0,0 +1,85 @@
+import asyncio
+import logging
+import typing
+
+import psycopg
+
+from bot.registry import listen_connection_params
+
+logger = logging.getLogger(__name__)
+
+MEMBER_LOCK = 2 ** 31 - 1
+
+HELD_LOCKS_SQL = '''
+    SELECT objid::int, pid FROM pg_locks
+    WHERE locktype = 'advisory' AND classid = %s AND objsubid = 2 AND granted
+      AND database = (SELECT oid FROM pg_database WHERE datname = current_database())
+'''
+
+
+class LeaderElection:
+    def __init__(self, key: int, shards: int = 1, interval: float = 2):
+        self.key = key
+        self.shards = max(shards, 1)
+        self.interval = interval
+        self.owned: typing.FrozenSet[int] = frozenset()
+        self._subscribers = []
+
+    @property
+    def is_leader(self) -> bool:
+        return bool(self.owned)
+
+    def owns(self, department_id: int) -> bool:
+        return department_id % self.shards in self.owned
+
+    def subscribe(self, callback):
+        self._subscribers.append(callback)
+
+    def _set_owned(self, owned):
+        owned = frozenset(owned)
+        if owned == self.owned:
+            return
+        logger.info('Monitoring shards %s of %s owned by this replica', sorted(owned), self.shards)
+        self.owned = owned
+        for callback in self._subscribers:
+            callback()
+
+    async def _balance(self, conn):
+        rows = await (await conn.execute(HELD_LOCKS_SQL, [self.key])).fetchall()
+        pid = conn.info.backend_pid
+        members = {holder for shard, holder in rows if shard == MEMBER_LOCK} | {pid}
+        rows = [(shard, holder) for shard, holder in rows if shard != MEMBER_LOCK]
+        held = {shard for shard, _ in rows}
+        owned = {shard for shard, holder in rows if holder == pid}
+        fair = -(-self.shards // len(members))
+        for shard in sorted(owned)[fair:]:
+            await conn.execute('SELECT pg_advisory_unlock(%s, %s)', [self.key, shard])
+            owned.discard(shard)
+        for shard in range(self.shards):
+            if len(owned) >= fair:
+                break
+            if shard not in held:
+                cursor = await conn.execute('SELECT pg_try_advisory_lock(%s, %s)', [self.key, shard])
+                if (await cursor.fetchone())[0]:
+                    owned.add(shard)
+        self._set_owned(owned)
+
+    async def run(self):
+        while True:
+            try:
+                conn = await psycopg.AsyncConnection.connect(
+                    **listen_connection_params(), autocommit=True, connect_timeout=max(int(self.interval * 2), 2)
+                )
+                async with conn:
+                    await conn.execute(
+                        'SET tcp_keepalives_idle = 5; SET tcp_keepalives_interval = 2; SET tcp_keepalives_count = 3'
+                    )
+                    await conn.execute('SELECT pg_advisory_lock_shared(%s, %s)', [self.key, MEMBER_LOCK])
+                    while True:
+                        await asyncio.wait_for(self._balance(conn), self.interval * 2)
+                        await asyncio.sleep(self.interval)
+            except (psycopg.Error, OSError, TimeoutError):
+                logger.exception('Lost monitoring leadership connection')
+            finally:
+                self._set_owned(())
+            await asyncio.sleep(self.interval)
@@ -0,0 +1,42 @@
+import datetime
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from bot.attendance import apply_status
+from bot.models import ActionLog, DailyAttendance, TgUser, UserStatus
+from bot.queries import local_date_range
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает дневную посещаемость по журналу действий'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', type=datetime.date.fromisoformat, help='Первая дата пересчета, ГГГГ-ММ-ДД')
+        parser.add_argument('--chunk-size', type=int, default=500, help='Сотрудников за одну транзакцию')
+
+    def handle(self, *args, since=None, chunk_size=500, **options):
+        users = list(TgUser.objects.order_by('id').values_list('id', 'department__begin'))
+        total = 0
+        for i in range(0, len(users), chunk_size):
+            chunk = dict(users[i:i + chunk_size])
+            logs = ActionLog.objects.filter(user_id__in=chunk).only('user_id', 'created', 'status_new')
+            attendance = DailyAttendance.objects.filter(user_id__in=chunk)
+            if since:
+                start, _ = local_date_range(since, since)
+                logs = logs.filter(created__gte=start)
+                attendance = attendance.filter(date__gte=since)
+            rows = {}
+            for log in logs.order_by('user_id', 'created').iterator(chunk_size=2000):
+                date = timezone.localdate(log.created)
+                row = rows.get((log.user_id, date))
+                if row is None:
+                    row = rows[log.user_id, date] = DailyAttendance(user_id=log.user_id, date=date)
+                apply_status(row, UserStatus(log.status_new), log.created, chunk[log.user_id])
+            with transaction.atomic():
+                attendance.delete()
+                DailyAttendance.objects.bulk_create(rows.values(), batch_size=1000)
+            total += len(rows)
+            self.stdout.write(f'{min(i + chunk_size, len(users))}/{len(users)} сотрудников, {total} дней')
+        self.stdout.write(self.style.SUCCESS(f'Готово: {total} дней'))
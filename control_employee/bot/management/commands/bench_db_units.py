@@ -0,0 +1,85 @@
+import asyncio
+import time
+
+from asgiref.sync import sync_to_async
+from django.core.management.base import BaseCommand
+
+from bot.db import db_unit
+from bot.models import ActionLog, TgUser, UserStatus
+
+BENCH_TG_ID_START = -1_000_000
+
+
+@sync_to_async
+def _update_status(user_id):
+    TgUser.objects.filter(id=user_id).update(status=UserStatus.BEGIN)
+
+
+@sync_to_async
+def _create_log(user_id):
+    return ActionLog.objects.create(user_id=user_id, status_new=UserStatus.BEGIN)
+
+
+@sync_to_async
+def _get_user(tg_id):
+    return TgUser.objects.get_or_create(tg_id=tg_id)[0]
+
+
+@sync_to_async
+def _get_department(user_id):
+    return TgUser.objects.filter(id=user_id).first()
+
+
+async def confirm_in_hops(user: TgUser):
+    # the confirmation as it was before db_unit: four thread_sensitive hops
+    await _update_status(user.id)
+    await _create_log(user.id)
+    await _get_user(user.tg_id)
+    await _get_department(user.id)
+
+
+@db_unit
+def _confirm(user_id):
+    TgUser.objects.filter(id=user_id).update(status=UserStatus.BEGIN)
+    return ActionLog.objects.create(user_id=user_id, status_new=UserStatus.BEGIN)
+
+
+async def confirm_in_unit(user: TgUser):
+    await _confirm(user.id)
+
+
+async def measure(confirm, users, rounds: int) -> float:
+    best = None
+    for _ in range(rounds):
+        await TgUser.objects.filter(id__in=[user.id for user in users]).aupdate(status=UserStatus.NA)
+        started = time.perf_counter()
+        await asyncio.gather(*(confirm(user) for user in users))
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает подтверждение статуса в одном db_unit и в нескольких sync_to_async вызовах'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200, help='Одновременных подтверждений')
+        parser.add_argument('--rounds', type=int, default=3, help='Повторов, берется лучший')
+
+    def handle(self, *args, users, rounds, **options):
+        asyncio.run(self.run(users, rounds))
+
+    async def run(self, users_count, rounds):
+        bench_users = TgUser.objects.filter(tg_id__lte=BENCH_TG_ID_START, tg_id__gt=BENCH_TG_ID_START - users_count)
+        await bench_users.adelete()
+        users = await TgUser.objects.abulk_create(
+            [TgUser(tg_id=BENCH_TG_ID_START - i) for i in range(users_count)]
+        )
+        try:
+            in_hops = await measure(confirm_in_hops, users, rounds)
+            in_unit = await measure(confirm_in_unit, users, rounds)
+        finally:
+            await bench_users.adelete()
+        self.stdout.write(f'{users_count} подтверждений, лучший из {rounds}:')
+        self.stdout.write(f'  sync_to_async вызовами: {in_hops:.3f} с')
+        self.stdout.write(f'  одним db_unit:          {in_unit:.3f} с')
@@ -0,0 +1,42 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from bot.partitions import archive_partition, attached_partitions, ensure_partitions, expired_partitions
+
+
+class Command(BaseCommand):
+    help = 'Создает будущие партиции журнала действий и архивирует старые в gzip CSV'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--ahead', type=int, default=settings.ACTIONLOG_PARTITIONS_AHEAD,
+            help='На сколько месяцев вперед создавать партиции'
+        )
+        parser.add_argument(
+            '--retention-months', type=int, default=settings.ACTIONLOG_RETENTION_MONTHS,
+            help='Сколько месяцев хранить в базе, 0 - не архивировать'
+        )
+        parser.add_argument(
+            '--archive-dir', default=str(settings.ACTIONLOG_ARCHIVE_DIR),
+            help='Каталог для архивов'
+        )
+        parser.add_argument(
+            '--keep-tables', action='store_true',
+            help='Только отсоединить архивированные партиции, не удаляя таблицы'
+        )
+        parser.add_argument('--list', action='store_true', help='Показать подключенные партиции')
+
+    def handle(self, *args, ahead, retention_months, archive_dir, keep_tables, list, **options):
+        if list:
+            for partition in attached_partitions():
+                self.stdout.write(
+                    f'{partition.name}: {partition.start:%Y-%m-%d %H:%M} - {partition.end:%Y-%m-%d %H:%M}'
+                )
+            return
+        for partition in ensure_partitions(ahead):
+            self.stdout.write(f'Создана партиция {partition.name}')
+        if retention_months:
+            for partition in expired_partitions(retention_months):
+                path = archive_partition(partition, archive_dir, drop=not keep_tables)
+                self.stdout.write(f'Партиция {partition.name} выгружена в {path}')
+        self.stdout.write(self.style.SUCCESS('Готово'))
@@ -0,0 +1,162 @@
+import asyncio
+import contextvars
+import logging
+import time
+import typing
+
+from aiogram import BaseMiddleware, Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import (TelegramAPIError, TelegramBadRequest, TelegramConflictError, TelegramEntityTooLarge,
+                                TelegramForbiddenError, TelegramNetworkError, TelegramNotFound, TelegramRetryAfter,
+                                TelegramServerError, TelegramUnauthorizedError)
+from aiogram.methods import TelegramMethod
+from aiogram.methods.base import TelegramType
+from aiogram.types import TelegramObject, Update
+from aiohttp import web
+from django.db.backends.signals import connection_created
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+
+logger = logging.getLogger(__name__)
+
+HANDLER_SECONDS = Histogram(
+    'bot_handler_seconds', 'Время обработки апдейта', ['handler'],
+    buckets=(.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10),
+)
+DB_QUERIES = Histogram(
+    'bot_db_queries_per_update', 'Запросов к базе на апдейт',
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55),
+)
+DB_SECONDS = Histogram(
+    'bot_db_seconds_per_update', 'Время запросов к базе на апдейт',
+    buckets=(.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1),
+)
+API_SECONDS = Histogram(
+    'bot_api_seconds', 'Время запроса к Bot API', ['method'],
+    buckets=(.025, .05, .1, .25, .5, 1, 2.5, 5, 10),
+)
+API_ERRORS = Counter('bot_api_errors_total', 'Ошибки Bot API', ['method', 'code'])
+MONITORING_TICK_SECONDS = Histogram(
+    'bot_monitoring_tick_seconds', 'Время проверки сроков мониторинга',
+    buckets=(.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5),
+)
+SEND_QUEUE_DEPTH = Gauge('bot_send_queue_depth', 'Запросов в очереди отправки')
+
+API_ERROR_CODES = {
+    TelegramBadRequest: '400',
+    TelegramUnauthorizedError: '401',
+    TelegramForbiddenError: '403',
+    TelegramNotFound: '404',
+    TelegramConflictError: '409',
+    TelegramEntityTooLarge: '413',
+    TelegramRetryAfter: '429',
+    TelegramServerError: '5xx',
+    TelegramNetworkError: 'network',
+}
+
+
+class UpdateStats:
+    __slots__ = ('handler', 'queries', 'db_seconds')
+
+    def __init__(self):
+        self.handler = None
+        self.queries = 0
+        self.db_seconds = 0.0
+
+
+update_stats: contextvars.ContextVar[typing.Optional[UpdateStats]] = contextvars.ContextVar(
+    'update_stats', default=None
+)
+
+
+def count_query(execute, sql, params, many, context):
+    stats = update_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.queries += 1
+        stats.db_seconds += time.perf_counter() - started
+
+
+def install_query_counter(sender, connection, **kwargs):
+    if count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(count_query)
+
+
+connection_created.connect(install_query_counter)
+
+
+class MetricsMiddleware(BaseMiddleware):
+    async def __call__(
+        self,
+        handler: typing.Callable[[TelegramObject, typing.Dict[str, typing.Any]], typing.Awaitable[typing.Any]],
+        event: TelegramObject,
+        data: typing.Dict[str, typing.Any],
+    ) -> typing.Any:
+        stats = UpdateStats()
+        token = update_stats.set(stats)
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            HANDLER_SECONDS.labels(stats.handler or self.unhandled(event)).observe(time.perf_counter() - started)
+            DB_QUERIES.observe(stats.queries)
+            DB_SECONDS.observe(stats.db_seconds)
+            update_stats.reset(token)
+
+    @staticmethod
+    def unhandled(event: TelegramObject) -> str:
+        if isinstance(event, Update):
+            return f'unhandled_{event.event_type}'
+        return 'unhandled'
+
+
+class HandlerNameMiddleware(BaseMiddleware):
+    async def __call__(
+        self,
+        handler: typing.Callable[[TelegramObject, typing.Dict[str, typing.Any]], typing.Awaitable[typing.Any]],
+        event: TelegramObject,
+        data: typing.Dict[str, typing.Any],
+    ) -> typing.Any:
+        stats = update_stats.get()
+        if stats is not None:
+            stats.handler = data['handler'].callback.__name__
+        return await handler(event, data)
+
+
+class ApiMetricsMiddleware(BaseRequestMiddleware):
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ) -> TelegramType:
+        name = type(method).__name__
+        started = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except TelegramAPIError as e:
+            API_ERRORS.labels(name, API_ERROR_CODES.get(type(e), type(e).__name__)).inc()
+            raise
+        finally:
+            API_SECONDS.labels(name).observe(time.perf_counter() - started)
+
+
+async def metrics_view(request: web.Request) -> web.Response:
+    return web.Response(body=generate_latest(), headers={'Content-Type': CONTENT_TYPE_LATEST})
+
+
+async def run_metrics_server(host: str, port: int):
+    app = web.Application()
+    app.router.add_get('/metrics', metrics_view)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    logger.info('Serving metrics on %s:%s/metrics', host, port)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
@@ -0,0 +1,29 @@
+# Generated by Django 5.1.2 on 2026-10-18 04:24
+
+from django.db import migrations
+from django.db.models import Count, Min
+
+
+def merge_duplicate_users(apps, schema_editor):
+    TgUser = apps.get_model('bot', 'TgUser')
+    ActionLog = apps.get_model('bot', 'ActionLog')
+    duplicates = (
+        TgUser.objects.values('tg_id')
+        .annotate(count=Count('id'), keep_id=Min('id'))
+        .filter(count__gt=1)
+    )
+    for duplicate in duplicates:
+        stale = TgUser.objects.filter(tg_id=duplicate['tg_id']).exclude(id=duplicate['keep_id'])
+        ActionLog.objects.filter(user__in=stale).update(user_id=duplicate['keep_id'])
+        stale.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot', '0007_alter_tguser_tg_id'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_users, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.1.2 on 2026-10-18 04:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot', '0008_merge_duplicate_tg_users'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='tguser',
+            name='tg_id',
+            field=models.BigIntegerField(unique=True),
+        ),
+        migrations.AlterField(
+            model_name='tguser',
+            name='user_type',
+            field=models.IntegerField(choices=[(1, 'Администратор'), (2, 'Сотрудник'), (3, 'Руководитель'), (4, 'Директор'), (5, 'Новый сотрудник'), (6, 'Отказано в регистрации')], db_index=True, default=5),
+        ),
+        migrations.AlterField(
+            model_name='tguser',
+            name='username',
+            field=models.CharField(blank=True, db_index=True, max_length=255, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='actionlog',
+            index=models.Index(fields=['user', 'created'], name='bot_actionl_user_id_eea98a_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tguser',
+            index=models.Index(fields=['department', 'status'], name='bot_tguser_departm_85d2b1_idx'),
+        ),
+    ]
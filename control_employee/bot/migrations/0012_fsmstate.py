@@ -0,0 +1,22 @@
+# Generated by Django 5.1.2 on 2026-10-18 04:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot', '0011_processedupdate'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FsmState',
+            fields=[
+                ('key', models.CharField(max_length=255, primary_key=True, serialize=False)),
+                ('state', models.CharField(blank=True, max_length=255, null=True)),
+                ('data', models.JSONField(default=dict)),
+                ('updated', models.DateTimeField(auto_now=True, db_index=True)),
+            ],
+        ),
+    ]
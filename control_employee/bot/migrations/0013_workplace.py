@@ -0,0 +1,24 @@
+# Generated by Django 5.1.2 on 2026-10-18 05:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot', '0012_fsmstate'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Workplace',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=1024, verbose_name='Название')),
+                ('latitude', models.FloatField(verbose_name='Широта')),
+                ('longitude', models.FloatField(verbose_name='Долгота')),
+                ('radius', models.PositiveIntegerField(default=100, verbose_name='Радиус, м')),
+                ('departments', models.ManyToManyField(blank=True, related_name='workplaces', to='bot.department')),
+            ],
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.1.2 on 2026-10-18 05:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot', '0013_workplace'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyAttendance',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('begin', models.DateTimeField(blank=True, null=True, verbose_name='Приход на работу')),
+                ('begin_lanch', models.DateTimeField(blank=True, null=True, verbose_name='Уход на обед')),
+                ('end_lanch', models.DateTimeField(blank=True, null=True, verbose_name='Приход с обеда')),
+                ('end', models.DateTimeField(blank=True, null=True, verbose_name='Уход с работы')),
+                ('minutes_late', models.PositiveIntegerField(default=0)),
+                ('minutes_worked', models.PositiveIntegerField(default=0)),
+                ('worked_since', models.DateTimeField(blank=True, null=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='bot.tguser')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user', 'date'), name='bot_dailyattendance_user_date_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,104 @@
+# Generated by Django 5.1.2 on 2026-10-18 09:12
+
+import datetime
+
+from django.db import migrations
+from django.utils import timezone
+
+PARTITIONS_AHEAD = 3
+
+
+def add_months(month, months):
+    years, month_index = divmod(month.month - 1 + months, 12)
+    return datetime.date(month.year + years, month_index + 1, 1)
+
+
+def month_bound(month):
+    return timezone.make_aware(datetime.datetime.combine(month, datetime.time.min), timezone.get_default_timezone())
+
+
+def partition_actionlog(apps, schema_editor):
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute('SELECT min(created) FROM bot_actionlog')
+        first, = cursor.fetchone()
+    current = timezone.localdate().replace(day=1)
+    month = timezone.localtime(first).date().replace(day=1) if first else current
+    month = min(month, current)
+
+    schema_editor.execute('ALTER TABLE bot_actionlog RENAME TO bot_actionlog_unpartitioned')
+    schema_editor.execute('ALTER INDEX bot_actionlog_pkey RENAME TO bot_actionlog_unpartitioned_pkey')
+    schema_editor.execute('ALTER INDEX bot_actionl_user_id_eea98a_idx RENAME TO bot_actionlog_unpartitioned_user_created')
+    schema_editor.execute('ALTER INDEX bot_actionlog_user_id_484e3f70 RENAME TO bot_actionlog_unpartitioned_user')
+    # identity columns are not supported on partitioned tables, use a plain owned sequence instead
+    schema_editor.execute('CREATE SEQUENCE bot_actionlog_partitioned_id_seq')
+    schema_editor.execute('''
+        CREATE TABLE bot_actionlog (
+            id bigint NOT NULL DEFAULT nextval('bot_actionlog_partitioned_id_seq'),
+            created timestamp with time zone NOT NULL,
+            status_before integer NOT NULL,
+            status_new integer NOT NULL,
+            user_id bigint NOT NULL,
+            CONSTRAINT bot_actionlog_pkey PRIMARY KEY (id, created),
+            CONSTRAINT bot_actionlog_user_id_484e3f70_fk_bot_tguser_id
+                FOREIGN KEY (user_id) REFERENCES bot_tguser (id) DEFERRABLE INITIALLY DEFERRED
+        ) PARTITION BY RANGE (created)
+    ''')
+    schema_editor.execute('CREATE INDEX bot_actionl_user_id_eea98a_idx ON bot_actionlog (user_id, created)')
+    schema_editor.execute('CREATE INDEX bot_actionlog_user_id_484e3f70 ON bot_actionlog (user_id)')
+    while month <= add_months(current, PARTITIONS_AHEAD):
+        schema_editor.execute(
+            f'CREATE TABLE bot_actionlog_p{month:%Y_%m} PARTITION OF bot_actionlog FOR VALUES FROM (%s) TO (%s)',
+            [month_bound(month), month_bound(add_months(month, 1))],
+        )
+        month = add_months(month, 1)
+    schema_editor.execute('''
+        INSERT INTO bot_actionlog (id, created, status_before, status_new, user_id)
+        SELECT id, created, status_before, status_new, user_id FROM bot_actionlog_unpartitioned
+    ''')
+    schema_editor.execute('DROP TABLE bot_actionlog_unpartitioned')
+    schema_editor.execute('ALTER SEQUENCE bot_actionlog_partitioned_id_seq RENAME TO bot_actionlog_id_seq')
+    schema_editor.execute('ALTER SEQUENCE bot_actionlog_id_seq OWNED BY bot_actionlog.id')
+    schema_editor.execute(
+        "SELECT setval('bot_actionlog_id_seq', COALESCE(max(id), 0) + 1, false) FROM bot_actionlog"
+    )
+
+
+def unpartition_actionlog(apps, schema_editor):
+    schema_editor.execute('ALTER TABLE bot_actionlog RENAME TO bot_actionlog_partitioned')
+    schema_editor.execute('ALTER INDEX bot_actionlog_pkey RENAME TO bot_actionlog_partitioned_pkey')
+    schema_editor.execute('ALTER INDEX bot_actionl_user_id_eea98a_idx RENAME TO bot_actionlog_partitioned_user_created')
+    schema_editor.execute('ALTER INDEX bot_actionlog_user_id_484e3f70 RENAME TO bot_actionlog_partitioned_user')
+    schema_editor.execute('ALTER SEQUENCE bot_actionlog_id_seq RENAME TO bot_actionlog_partitioned_id_seq')
+    schema_editor.execute('''
+        CREATE TABLE bot_actionlog (
+            id bigint NOT NULL GENERATED BY DEFAULT AS IDENTITY,
+            created timestamp with time zone NOT NULL,
+            status_before integer NOT NULL,
+            status_new integer NOT NULL,
+            user_id bigint NOT NULL,
+            CONSTRAINT bot_actionlog_pkey PRIMARY KEY (id),
+            CONSTRAINT bot_actionlog_user_id_484e3f70_fk_bot_tguser_id
+                FOREIGN KEY (user_id) REFERENCES bot_tguser (id) DEFERRABLE INITIALLY DEFERRED
+        )
+    ''')
+    schema_editor.execute('CREATE INDEX bot_actionl_user_id_eea98a_idx ON bot_actionlog (user_id, created)')
+    schema_editor.execute('CREATE INDEX bot_actionlog_user_id_484e3f70 ON bot_actionlog (user_id)')
+    schema_editor.execute('''
+        INSERT INTO bot_actionlog (id, created, status_before, status_new, user_id)
+        SELECT id, created, status_before, status_new, user_id FROM bot_actionlog_partitioned
+    ''')
+    schema_editor.execute('DROP TABLE bot_actionlog_partitioned')
+    schema_editor.execute(
+        "SELECT setval(pg_get_serial_sequence('bot_actionlog', 'id'), COALESCE(max(id), 0) + 1, false) FROM bot_actionlog"
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot', '0014_dailyattendance'),
+    ]
+
+    operations = [
+        migrations.RunPython(partition_actionlog, unpartition_actionlog),
+    ]
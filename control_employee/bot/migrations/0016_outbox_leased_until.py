@@ -0,0 +1,18 @@
+# Generated by Django 5.1.2 on 2026-10-18 10:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot', '0015_partition_actionlog'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='outbox',
+            name='leased_until',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
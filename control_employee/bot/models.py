@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 
 
 class UserType(models.IntegerChoices):
@@ -18,6 +19,17 @@ class UserStatus(models.IntegerChoices):
     END = 5, 'Уход с работы'
 
 
+def display_name(last_name, first_name, username):
+    result = ''
+    last_name = last_name or ''
+    first_name = first_name or ''
+    if any((last_name, first_name)):
+        result = ' '.join((last_name, first_name))
+    elif username:
+        result = username
+    return result
+
+
 class Department(models.Model):
     name = models.CharField(max_length=1024)
     begin = models.TimeField('Начало рабочего времени', null=True, blank=True)
@@ -26,25 +38,34 @@ class Department(models.Model):
     end = models.TimeField('Конец дня', null=True, blank=True)
 
 
+class Workplace(models.Model):
+    name = models.CharField('Название', max_length=1024)
+    latitude = models.FloatField('Широта')
+    longitude = models.FloatField('Долгота')
+    radius = models.PositiveIntegerField('Радиус, м', default=100)
+    departments = models.ManyToManyField(Department, related_name='workplaces', blank=True)
+
+    def __str__(self):
+        return self.name
+
+
 class TgUser(models.Model):
-    tg_id = models.BigIntegerField()
-    username = models.CharField(max_length=255, null=True, blank=True)
+    tg_id = models.BigIntegerField(unique=True)
+    username = models.CharField(max_length=255, null=True, blank=True, db_index=True)
     first_name = models.CharField(max_length=255, null=True, blank=True)
     last_name = models.CharField(max_length=255, null=True, blank=True)
-    user_type = models.IntegerField(choices=UserType, default=UserType.NEW.value)
+    user_type = models.IntegerField(choices=UserType, default=UserType.NEW.value, db_index=True)
     status = models.IntegerField(choices=UserStatus, default=UserStatus.NA)
     department = models.ForeignKey(Department, on_delete=models.CASCADE, null=True, blank=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['department', 'status']),
+        ]
+
     @property
     def name(self):
-        result = ''
-        last_name = self.last_name or ''
-        first_name = self.first_name or ''
-        if any((last_name, first_name)):
-            result = ' '.join((last_name, first_name))
-        elif self.username:
-            result = self.username
-        return result
+        return display_name(self.last_name, self.first_name, self.username)
 
 
 class ActionLog(models.Model):
@@ -52,3 +73,53 @@ class ActionLog(models.Model):
     created = models.DateTimeField(auto_now_add=True)
     status_before = models.IntegerField(choices=UserStatus, default=UserStatus.NA)
     status_new = models.IntegerField(choices=UserStatus, default=UserStatus.NA)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'created']),
+        ]
+
+
+class DailyAttendance(models.Model):
+    user = models.ForeignKey(TgUser, on_delete=models.CASCADE)
+    date = models.DateField()
+    begin = models.DateTimeField('Приход на работу', null=True, blank=True)
+    begin_lanch = models.DateTimeField('Уход на обед', null=True, blank=True)
+    end_lanch = models.DateTimeField('Приход с обеда', null=True, blank=True)
+    end = models.DateTimeField('Уход с работы', null=True, blank=True)
+    minutes_late = models.PositiveIntegerField(default=0)
+    minutes_worked = models.PositiveIntegerField(default=0)
+    worked_since = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'date'], name='bot_dailyattendance_user_date_uniq'),
+        ]
+
+
+class Outbox(models.Model):
+    chat_id = models.BigIntegerField()
+    text = models.TextField()
+    created = models.DateTimeField(auto_now_add=True)
+    available_at = models.DateTimeField(default=timezone.now)
+    leased_until = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    failed = models.BooleanField(default=False)
+    last_error = models.TextField(blank=True, default='')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['available_at'], condition=models.Q(failed=False), name='bot_outbox_pending_idx'),
+        ]
+
+
+class ProcessedUpdate(models.Model):
+    key = models.CharField(max_length=255, primary_key=True)
+    expires = models.DateTimeField(db_index=True)
+
+
+class FsmState(models.Model):
+    key = models.CharField(max_length=255, primary_key=True)
+    state = models.CharField(max_length=255, null=True, blank=True)
+    data = models.JSONField(default=dict)
+    updated = models.DateTimeField(auto_now=True, db_index=True)
@@ -0,0 +1,152 @@
+import asyncio
+import datetime
+import logging
+import typing
+
+from aiogram import Bot
+from aiogram.methods import SendMessage
+from django.db import connection
+from django.db.models import F
+from django.utils import timezone
+
+from bot.db import db_unit
+from bot.models import Outbox
+from bot.send_queue import Priority, SendQueue
+
+logger = logging.getLogger(__name__)
+
+CLAIM_LOCK = 'bot_outbox_claim'
+
+
+class OutboxDispatcher:
+    def __init__(
+        self,
+        bot: Bot,
+        queue: SendQueue,
+        batch_size: int = 50,
+        interval: float = 5,
+        lease: float = 60,
+        max_attempts: int = 10,
+        max_backoff: float = 3600,
+    ):
+        self.bot = bot
+        self.queue = queue
+        self.batch_size = batch_size
+        self.interval = interval
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self.max_backoff = max_backoff
+        self._wake = asyncio.Event()
+
+    def wake(self):
+        self._wake.set()
+
+    @staticmethod
+    @db_unit
+    def _ready_chats() -> typing.List[int]:
+        now = timezone.now()
+        busy = Outbox.objects.filter(leased_until__gt=now).values('chat_id')
+        return list(
+            Outbox.objects.filter(failed=False, available_at__lte=now)
+            .exclude(chat_id__in=busy)
+            .values_list('chat_id', flat=True)
+            .distinct()
+        )
+
+    @staticmethod
+    @db_unit
+    def _claim(budgets: typing.Dict[int, int], lease: float) -> typing.List[Outbox]:
+        # claims are serialized so that a chat is drained by one dispatcher at a time
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_xact_lock(hashtext(%s))', [CLAIM_LOCK])
+        now = timezone.now()
+        busy = set(Outbox.objects.filter(leased_until__gt=now).values_list('chat_id', flat=True))
+        rows = []
+        for chat_id, budget in budgets.items():
+            if chat_id not in busy:
+                rows += Outbox.objects.filter(
+                    chat_id=chat_id, failed=False, available_at__lte=now
+                ).order_by('available_at', 'id')[:budget]
+        if rows:
+            leased_until = now + datetime.timedelta(seconds=lease)
+            Outbox.objects.filter(id__in=[row.id for row in rows]).update(
+                available_at=leased_until, leased_until=leased_until, attempts=F('attempts') + 1
+            )
+        return rows
+
+    @staticmethod
+    @db_unit
+    def _extend(ids: typing.List[int], lease: float):
+        leased_until = timezone.now() + datetime.timedelta(seconds=lease)
+        Outbox.objects.filter(id__in=ids).update(available_at=leased_until, leased_until=leased_until)
+
+    @staticmethod
+    @db_unit
+    def _sent(row_id: int):
+        Outbox.objects.filter(id=row_id).delete()
+
+    @db_unit
+    def _retry(self, row: Outbox, error: BaseException):
+        attempts = row.attempts + 1
+        if attempts >= self.max_attempts:
+            logger.error('Giving up on outbox message %s after %s attempts: %s', row.id, attempts, error)
+            Outbox.objects.filter(id=row.id).update(failed=True, leased_until=None, last_error=repr(error))
+            return
+        delay = min(self.interval * 2 ** attempts, self.max_backoff)
+        Outbox.objects.filter(id=row.id).update(
+            available_at=timezone.now() + datetime.timedelta(seconds=delay), leased_until=None, last_error=repr(error)
+        )
+
+    async def _send(self, row: Outbox):
+        future = self.queue.send(self.bot, SendMessage(chat_id=row.chat_id, text=row.text), Priority.ALERT)
+        if future is None:
+            raise asyncio.QueueFull
+        await future
+
+    async def _deliver(self, row: Outbox, pending: typing.Set[int]):
+        try:
+            await self._send(row)
+        except Exception as e:
+            await self._retry(row, e)
+        else:
+            await self._sent(row.id)
+        finally:
+            pending.discard(row.id)
+
+    async def _renew(self, pending: typing.Set[int]):
+        while pending:
+            await asyncio.sleep(self.lease / 3)
+            if pending:
+                await self._extend(list(pending), self.lease)
+
+    async def drain(self) -> int:
+        budgets = {}
+        for chat_id in await self._ready_chats():
+            budget = min(self.queue.capacity(chat_id, self.lease / 2), self.batch_size)
+            if budget:
+                budgets[chat_id] = budget
+        if not budgets:
+            return 0
+        rows = await self._claim(budgets, self.lease)
+        if not rows:
+            return 0
+        pending = {row.id for row in rows}
+        renew = asyncio.create_task(self._renew(pending))
+        try:
+            await asyncio.gather(*(self._deliver(row, pending) for row in rows))
+        finally:
+            renew.cancel()
+        return len(rows)
+
+    async def run(self):
+        while True:
+            self._wake.clear()
+            try:
+                if await self.drain() >= self.batch_size:
+                    continue
+            except Exception:
+                logger.exception('Failed to drain outbox')
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.interval)
+            except TimeoutError:
+                pass
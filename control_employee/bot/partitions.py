@@ -0,0 +1,140 @@
+import asyncio
+import datetime
+import gzip
+import logging
+import os
+import typing
+
+from django.db import connection, transaction
+from django.utils import timezone
+from psycopg import sql
+
+from bot.db import db_unit
+
+logger = logging.getLogger(__name__)
+
+PARENT_TABLE = 'bot_actionlog'
+PARTITION_PREFIX = 'bot_actionlog_p'
+MAINTENANCE_LOCK = 'bot_actionlog_partitions'
+
+
+def add_months(month: datetime.date, months: int) -> datetime.date:
+    years, month_index = divmod(month.month - 1 + months, 12)
+    return datetime.date(month.year + years, month_index + 1, 1)
+
+
+def month_bound(month: datetime.date) -> datetime.datetime:
+    return timezone.make_aware(datetime.datetime.combine(month, datetime.time.min), timezone.get_default_timezone())
+
+
+class Partition(typing.NamedTuple):
+    name: str
+    month: datetime.date
+
+    @classmethod
+    def for_month(cls, month: datetime.date):
+        month = month.replace(day=1)
+        return cls(f'{PARTITION_PREFIX}{month:%Y_%m}', month)
+
+    @property
+    def start(self) -> datetime.datetime:
+        return month_bound(self.month)
+
+    @property
+    def end(self) -> datetime.datetime:
+        return month_bound(add_months(self.month, 1))
+
+
+def _lock(cursor):
+    cursor.execute('SELECT pg_advisory_xact_lock(hashtext(%s))', [MAINTENANCE_LOCK])
+
+
+def attached_partitions() -> typing.List[Partition]:
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid '
+            'WHERE i.inhparent = %s::regclass ORDER BY c.relname',
+            [PARENT_TABLE],
+        )
+        names = [name for name, in cursor.fetchall()]
+    partitions = []
+    for name in names:
+        try:
+            month = datetime.datetime.strptime(name[len(PARTITION_PREFIX):], '%Y_%m').date()
+        except ValueError:
+            continue
+        partitions.append(Partition(name, month))
+    return partitions
+
+
+def create_partition(cursor, partition: Partition):
+    cursor.execute(sql.SQL(
+        'CREATE TABLE IF NOT EXISTS {} PARTITION OF {} FOR VALUES FROM ({}) TO ({})'
+    ).format(
+        sql.Identifier(partition.name),
+        sql.Identifier(PARENT_TABLE),
+        sql.Literal(partition.start),
+        sql.Literal(partition.end),
+    ))
+
+
+def ensure_partitions(ahead: int = 3) -> typing.List[Partition]:
+    current = timezone.localdate().replace(day=1)
+    created = []
+    with transaction.atomic(), connection.cursor() as cursor:
+        _lock(cursor)
+        existing = {partition.month for partition in attached_partitions()}
+        for i in range(ahead + 1):
+            partition = Partition.for_month(add_months(current, i))
+            if partition.month not in existing:
+                create_partition(cursor, partition)
+                created.append(partition)
+    return created
+
+
+def archive_partition(partition: Partition, directory: str, drop: bool = True) -> str:
+    path = os.path.join(directory, f'{partition.name}.csv.gz')
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = f'{path}.tmp'
+    try:
+        with connection.cursor() as cursor, gzip.open(tmp_path, 'wb') as archive:
+            copy_sql = sql.SQL('COPY {} TO STDOUT WITH (FORMAT csv, HEADER)').format(sql.Identifier(partition.name))
+            with cursor.cursor.copy(copy_sql) as copy:
+                for data in copy:
+                    archive.write(data)
+        with open(tmp_path, 'rb') as archive:
+            os.fsync(archive.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    with transaction.atomic(), connection.cursor() as cursor:
+        _lock(cursor)
+        cursor.execute(sql.SQL('ALTER TABLE {} DETACH PARTITION {}').format(
+            sql.Identifier(PARENT_TABLE), sql.Identifier(partition.name)
+        ))
+        if drop:
+            cursor.execute(sql.SQL('DROP TABLE {}').format(sql.Identifier(partition.name)))
+    return path
+
+
+def expired_partitions(retention_months: int) -> typing.List[Partition]:
+    before = add_months(timezone.localdate().replace(day=1), -retention_months)
+    return [partition for partition in attached_partitions() if partition.month < before]
+
+
+async def run_maintenance(ahead: int, retention_months: int = 0, directory: typing.Optional[str] = None,
+                          interval: float = 86400):
+    while True:
+        try:
+            for partition in await db_unit(ensure_partitions)(ahead):
+                logger.info('Created partition %s', partition.name)
+            if retention_months and directory:
+                # one transaction per partition so DETACH holds its lock only briefly
+                for partition in await db_unit(expired_partitions)(retention_months):
+                    path = await db_unit(archive_partition)(partition, directory)
+                    logger.info('Archived partition %s to %s', partition.name, path)
+        except Exception:
+            logger.exception('Failed to maintain action log partitions')
+        await asyncio.sleep(interval)
@@ -0,0 +1,192 @@
+import datetime
+import typing
+
+from django.db import connection
+from django.db.models import Q
+from django.utils import timezone
+
+from bot.db import db_unit
+from bot.models import ActionLog, Department, TgUser, UserStatus, display_name
+from bot.scheduler import Deadline
+
+
+class DepartmentSnapshot(typing.NamedTuple):
+    id: int
+    name: str
+    begin: typing.Optional[datetime.time]
+    begin_lanch: typing.Optional[datetime.time]
+    end_lanch: typing.Optional[datetime.time]
+    end: typing.Optional[datetime.time]
+
+    @classmethod
+    def from_model(cls, department: Department):
+        return cls(
+            department.id,
+            department.name,
+            department.begin,
+            department.begin_lanch,
+            department.end_lanch,
+            department.end,
+        )
+
+
+class UserSnapshot(typing.NamedTuple):
+    id: int
+    tg_id: int
+    username: typing.Optional[str]
+    first_name: typing.Optional[str]
+    last_name: typing.Optional[str]
+    user_type: int
+    status: int
+    department_id: typing.Optional[int]
+
+    @property
+    def name(self):
+        return display_name(self.last_name, self.first_name, self.username)
+
+    @classmethod
+    def from_model(cls, user: TgUser):
+        return cls(
+            user.id,
+            user.tg_id,
+            user.username,
+            user.first_name,
+            user.last_name,
+            user.user_type,
+            user.status,
+            user.department_id,
+        )
+
+
+def local_date_range(from_date: datetime.date, to_date: datetime.date):
+    tz = timezone.get_default_timezone()
+    start = timezone.make_aware(datetime.datetime.combine(from_date, datetime.time.min), tz)
+    end = timezone.make_aware(datetime.datetime.combine(to_date + datetime.timedelta(days=1), datetime.time.min), tz)
+    return start, end
+
+
+ALERT_STATUS_FILTERS = {
+    Deadline.begin: ~Q(status=UserStatus.BEGIN),
+    Deadline.end_lanch: Q(status=UserStatus.BEGIN_LANCH),
+}
+
+
+def is_alert_candidate(status: UserStatus, deadline: Deadline) -> bool:
+    if deadline is Deadline.begin:
+        return status is not UserStatus.BEGIN
+    return status is UserStatus.BEGIN_LANCH
+
+
+def alert_candidates_query(due: typing.Iterable[typing.Tuple[int, Deadline]]):
+    department_ids = {}
+    for department_id, deadline in due:
+        department_ids.setdefault(deadline, set()).add(department_id)
+    condition = Q()
+    for deadline, ids in department_ids.items():
+        condition |= Q(department_id__in=ids) & ALERT_STATUS_FILTERS[deadline]
+    return TgUser.objects.filter(condition) if condition else None
+
+
+async def get_alert_candidates(due: typing.Iterable[typing.Tuple[int, Deadline]]) -> typing.List[UserSnapshot]:
+    qs = alert_candidates_query(due)
+    if qs is None:
+        return []
+    return [UserSnapshot.from_model(user) async for user in qs]
+
+
+def action_log_query(user_id: int, from_date: datetime.date, to_date: datetime.date):
+    start, end = local_date_range(from_date, to_date)
+    return ActionLog.objects.filter(
+        user_id=user_id, created__gte=start, created__lt=end
+    ).only('created', 'status_new').order_by('created')
+
+
+PAGE_SIZE = 10
+
+
+class Page(typing.NamedTuple):
+    rows: list
+    prev_cursor: typing.Optional[int] = None
+    next_cursor: typing.Optional[int] = None
+
+
+async def paginate(qs, cursor: typing.Optional[int] = None, backward: bool = False, page_size: int = PAGE_SIZE) -> Page:
+    if backward and cursor is not None:
+        rows = [row async for row in qs.filter(id__lt=cursor).order_by('-id')[:page_size + 1]]
+        if rows:
+            has_previous = len(rows) > page_size
+            rows = rows[:page_size][::-1]
+            return Page(rows, rows[0].id if has_previous else None, rows[-1].id)
+        cursor = None
+    page_qs = qs if cursor is None else qs.filter(id__gt=cursor)
+    rows = [row async for row in page_qs.order_by('id')[:page_size + 1]]
+    has_next = len(rows) > page_size
+    rows = rows[:page_size]
+    has_previous = cursor is not None and bool(rows) and await qs.filter(id__lt=rows[0].id).aexists()
+    return Page(rows, rows[0].id if has_previous else None, rows[-1].id if has_next else None)
+
+
+DEPARTMENT_REPORT_SQL = '''
+WITH events AS (
+    SELECT
+        l.user_id,
+        l.status_new,
+        l.created,
+        (l.created AT TIME ZONE %(tz)s)::date AS day,
+        (l.created AT TIME ZONE %(tz)s)::time AS at,
+        LEAD(l.created) OVER (
+            PARTITION BY l.user_id, (l.created AT TIME ZONE %(tz)s)::date ORDER BY l.created
+        ) AS next_created,
+        ROW_NUMBER() OVER (
+            PARTITION BY l.user_id, (l.created AT TIME ZONE %(tz)s)::date, l.status_new ORDER BY l.created
+        ) AS nth
+    FROM bot_actionlog l
+    JOIN bot_tguser u ON u.id = l.user_id
+    WHERE u.department_id = %(department_id)s AND l.created >= %(start)s AND l.created < %(end)s
+)
+SELECT
+    u.last_name,
+    u.first_name,
+    u.username,
+    COUNT(DISTINCT e.day) FILTER (WHERE e.status_new = %(begin)s) AS days,
+    COUNT(*) FILTER (WHERE e.status_new = %(begin)s AND e.nth = 1 AND e.at > d.begin) AS late,
+    COALESCE(SUM(EXTRACT(EPOCH FROM COALESCE(
+        e.next_created, CASE WHEN e.day = %(today)s THEN %(now)s END
+    ) - e.created)) FILTER (WHERE e.status_new IN (%(begin)s, %(end_lanch)s)), 0)::int / 60 AS minutes
+FROM bot_tguser u
+JOIN bot_department d ON d.id = u.department_id
+LEFT JOIN events e ON e.user_id = u.id
+WHERE u.department_id = %(department_id)s
+GROUP BY u.id, d.begin
+ORDER BY u.last_name, u.first_name, u.username
+'''
+
+
+class DepartmentReportRow(typing.NamedTuple):
+    name: str
+    days: int
+    late: int
+    minutes: int
+
+
+@db_unit
+def get_department_report(
+    department_id: int, from_date: datetime.date, to_date: datetime.date
+) -> typing.List[DepartmentReportRow]:
+    start, end = local_date_range(from_date, to_date)
+    params = {
+        'tz': timezone.get_default_timezone_name(),
+        'department_id': department_id,
+        'start': start,
+        'end': end,
+        'today': timezone.localdate(),
+        'now': timezone.now(),
+        'begin': UserStatus.BEGIN.value,
+        'end_lanch': UserStatus.END_LANCH.value,
+    }
+    with connection.cursor() as cursor:
+        cursor.execute(DEPARTMENT_REPORT_SQL, params)
+        return [
+            DepartmentReportRow(display_name(last_name, first_name, username), days, late, minutes)
+            for last_name, first_name, username, days, late, minutes in cursor.fetchall()
+        ]
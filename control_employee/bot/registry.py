@@ -0,0 +1,106 @@
+import asyncio
+import logging
+import typing
+import uuid
+
+import psycopg
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connection
+
+from bot.models import Department
+from bot.queries import DepartmentSnapshot
+
+logger = logging.getLogger(__name__)
+
+RECONNECT_DELAY = 5
+
+
+def listen_connection_params(alias='default'):
+    db = settings.DATABASES[alias]
+    params = {
+        'dbname': db['NAME'],
+        'user': db['USER'],
+        'password': db['PASSWORD'],
+        'host': db['HOST'],
+    }
+    if db.get('PORT'):
+        params['port'] = db['PORT']
+    return params
+
+
+async def listen(channel: str, handle, on_connect=None):
+    while True:
+        try:
+            async with await psycopg.AsyncConnection.connect(**listen_connection_params(), autocommit=True) as conn:
+                await conn.execute(f'LISTEN {channel}')
+                if on_connect is not None:
+                    await on_connect()
+                async for notify in conn.notifies():
+                    await handle(notify.payload)
+        except psycopg.Error:
+            logger.exception('Lost %s notifications connection', channel)
+        await asyncio.sleep(RECONNECT_DELAY)
+
+
+class DepartmentRegistry:
+    channel = 'department_changed'
+
+    def __init__(self):
+        self.version = 0
+        self.instance = uuid.uuid4().hex
+        self._departments: typing.Dict[int, DepartmentSnapshot] = {}
+        self._subscribers = []
+
+    def get(self, department_id: typing.Optional[int]) -> typing.Optional[DepartmentSnapshot]:
+        if department_id is None:
+            return None
+        return self._departments.get(department_id)
+
+    def all(self) -> typing.List[DepartmentSnapshot]:
+        return sorted(self._departments.values(), key=lambda department: department.id)
+
+    def subscribe(self, callback):
+        self._subscribers.append(callback)
+
+    @staticmethod
+    @sync_to_async
+    def _load(department_id=None):
+        qs = Department.objects.all()
+        if department_id is not None:
+            qs = qs.filter(id=department_id)
+        return [DepartmentSnapshot.from_model(department) for department in qs]
+
+    @staticmethod
+    @sync_to_async
+    def _notify(channel, payload):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_notify(%s, %s)', [channel, payload])
+
+    def _bump(self):
+        self.version += 1
+        for callback in self._subscribers:
+            callback()
+
+    async def load(self, department_id: typing.Optional[int] = None):
+        departments = await self._load(department_id)
+        if department_id is None:
+            self._departments = {department.id: department for department in departments}
+        elif departments:
+            self._departments[department_id] = departments[0]
+        else:
+            self._departments.pop(department_id, None)
+        self._bump()
+
+    async def changed(self, department_id: typing.Optional[int] = None):
+        await self.load(department_id)
+        payload = self.instance if department_id is None else f'{self.instance}:{department_id}'
+        await self._notify(self.channel, payload)
+
+    async def _handle(self, payload: str):
+        instance, _, department_id = payload.partition(':')
+        if instance != self.instance:
+            await self.load(int(department_id) if department_id else None)
+
+    async def listen(self):
+        await listen(self.channel, self._handle, on_connect=self.load)
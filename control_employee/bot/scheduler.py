@@ -0,0 +1,77 @@
+import asyncio
+import datetime
+import heapq
+import logging
+from enum import Enum
+
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+
+class Deadline(str, Enum):
+    begin = 'begin'
+    end_lanch = 'end_lanch'
+
+
+class AttendanceScheduler:
+    def __init__(self, load_departments, on_due):
+        self.load_departments = load_departments
+        self.on_due = on_due
+        self._heap = []
+        self._departments = {}
+        self._checked_at = None
+        self._rebuild = asyncio.Event()
+
+    def rebuild(self):
+        self._rebuild.set()
+
+    @staticmethod
+    def next_run(at: datetime.time, after: datetime.datetime) -> datetime.datetime:
+        day = after.date()
+        run = timezone.make_aware(datetime.datetime.combine(day, at))
+        if run <= after:
+            run = timezone.make_aware(datetime.datetime.combine(day + datetime.timedelta(days=1), at))
+        return run
+
+    async def build(self):
+        self._rebuild.clear()
+        if self._checked_at is None:
+            self._checked_at = timezone.localtime()
+        self._departments = {department.id: department for department in await self.load_departments()}
+        self._heap = []
+        for department in self._departments.values():
+            for deadline in Deadline:
+                at = getattr(department, deadline.value)
+                if at is not None:
+                    self._heap.append((self.next_run(at, self._checked_at), department.id, deadline))
+        heapq.heapify(self._heap)
+
+    async def fire_due(self):
+        now = timezone.localtime()
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            run, department_id, deadline = heapq.heappop(self._heap)
+            department = self._departments[department_id]
+            due.append((department, deadline))
+            at = getattr(department, deadline.value)
+            heapq.heappush(self._heap, (self.next_run(at, now), department_id, deadline))
+        self._checked_at = now
+        if due:
+            try:
+                await self.on_due(due)
+            except Exception:
+                logger.exception('Failed to process deadlines %s', due)
+
+    async def run(self):
+        while True:
+            await self.build()
+            while not self._rebuild.is_set():
+                timeout = None
+                if self._heap:
+                    timeout = max((self._heap[0][0] - timezone.localtime()).total_seconds(), 0)
+                try:
+                    await asyncio.wait_for(self._rebuild.wait(), timeout)
+                except TimeoutError:
+                    await self.fire_due()
+            await self.fire_due()
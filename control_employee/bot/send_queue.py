@@ -0,0 +1,235 @@
+import asyncio
+import contextvars
+import functools
+import itertools
+import logging
+import time
+import typing
+from collections import OrderedDict
+from enum import IntEnum
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import DeleteMessage, DeleteMessages, TelegramMethod
+from aiogram.methods.base import TelegramType
+
+logger = logging.getLogger(__name__)
+
+_in_worker = contextvars.ContextVar('send_queue_worker', default=False)
+
+
+class Priority(IntEnum):
+    INTERACTIVE = 0
+    ALERT = 1
+    BACKGROUND = 2
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self) -> float:
+        now = time.monotonic()
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def available(self, seconds: float) -> int:
+        now = time.monotonic()
+        if now < self.blocked_until:
+            return max(int((now + seconds - self.blocked_until) * self.rate), 0)
+        self._refill(now)
+        return int(self.tokens + seconds * self.rate)
+
+    def consume(self):
+        self.tokens -= 1
+
+    def pause(self, seconds: float):
+        self.blocked_until = time.monotonic() + seconds
+        self.tokens = 0
+        self.updated = self.blocked_until
+
+
+class QueuedRequest:
+    __slots__ = ('call', 'chat_id', 'future', 'attempts')
+
+    def __init__(self, call, chat_id, future):
+        self.call = call
+        self.chat_id = chat_id
+        self.future = future
+        self.attempts = 0
+
+
+class SendQueue:
+    def __init__(
+        self,
+        workers: int = 8,
+        maxsize: int = 10000,
+        global_rate: float = 30,
+        private_rate: float = 1,
+        private_burst: float = 3,
+        group_rate: float = 20 / 60,
+        group_burst: float = 3,
+        chats: int = 10000,
+        max_retries: int = 5,
+    ):
+        self.workers = workers
+        self.maxsize = maxsize
+        self.private_rate = private_rate
+        self.private_burst = private_burst
+        self.group_rate = group_rate
+        self.group_burst = group_burst
+        self.chats = chats
+        self.max_retries = max_retries
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self._buckets: typing.OrderedDict[int, TokenBucket] = OrderedDict()
+        self._queue: asyncio.PriorityQueue = asyncio.PriorityQueue()
+        self._counter = itertools.count()
+        self._pending = 0
+        self._chat_pending: typing.Dict[int, int] = {}
+        self._tasks = []
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    @property
+    def depth(self) -> int:
+        return self._pending
+
+    def start(self):
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def _bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._buckets.get(chat_id)
+        if bucket is None:
+            if chat_id < 0:
+                bucket = TokenBucket(self.group_rate, self.group_burst)
+            else:
+                bucket = TokenBucket(self.private_rate, self.private_burst)
+            self._buckets[chat_id] = bucket
+            if len(self._buckets) > self.chats:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(chat_id)
+        return bucket
+
+    def capacity(self, chat_id: int, seconds: float) -> int:
+        return max(self._bucket(chat_id).available(seconds) - self._chat_pending.get(chat_id, 0), 0)
+
+    def _enqueue(self, call, chat_id, priority: Priority) -> asyncio.Future:
+        if self._pending >= self.maxsize:
+            raise asyncio.QueueFull
+        future = asyncio.get_running_loop().create_future()
+        self._pending += 1
+        self._chat_pending[chat_id] = self._chat_pending.get(chat_id, 0) + 1
+        future.add_done_callback(functools.partial(self._done, chat_id))
+        self._queue.put_nowait((priority, next(self._counter), QueuedRequest(call, chat_id, future)))
+        return future
+
+    def _done(self, chat_id, future: asyncio.Future):
+        self._pending -= 1
+        if self._chat_pending[chat_id] > 1:
+            self._chat_pending[chat_id] -= 1
+        else:
+            del self._chat_pending[chat_id]
+
+    def send(
+        self, bot: Bot, method: TelegramMethod, priority: Priority = Priority.ALERT
+    ) -> typing.Optional[asyncio.Future]:
+        try:
+            future = self._enqueue(lambda: bot(method), getattr(method, 'chat_id', None), priority)
+        except asyncio.QueueFull:
+            logger.warning('Send queue is full, dropping %s', type(method).__name__)
+            return None
+        future.add_done_callback(self._log_failure)
+        return future
+
+    async def submit(self, call, chat_id, priority: Priority):
+        while True:
+            try:
+                future = self._enqueue(call, chat_id, priority)
+            except asyncio.QueueFull:
+                await asyncio.sleep(0.1)
+            else:
+                return await future
+
+    @staticmethod
+    def _log_failure(future: asyncio.Future):
+        if not future.cancelled() and future.exception():
+            logger.error('Failed to send queued request', exc_info=future.exception())
+
+    def _requeue(self, entry, delay: float):
+        asyncio.get_running_loop().call_later(delay, self._queue.put_nowait, entry)
+
+    async def _worker(self):
+        _in_worker.set(True)
+        while True:
+            entry = await self._queue.get()
+            request = entry[2]
+            if request.future.done():
+                continue
+            bucket = self._bucket(request.chat_id) if isinstance(request.chat_id, int) else None
+            delay = max(self.global_bucket.delay(), bucket.delay() if bucket else 0)
+            if delay > 0:
+                self._requeue(entry, delay)
+                continue
+            self.global_bucket.consume()
+            if bucket:
+                bucket.consume()
+            try:
+                result = await request.call()
+            except TelegramRetryAfter as e:
+                request.attempts += 1
+                if bucket:
+                    bucket.pause(e.retry_after)
+                else:
+                    self.global_bucket.pause(e.retry_after)
+                if request.attempts > self.max_retries:
+                    request.future.set_exception(e)
+                else:
+                    self._requeue(entry, e.retry_after)
+            except Exception as e:
+                if not request.future.done():
+                    request.future.set_exception(e)
+            else:
+                if not request.future.done():
+                    request.future.set_result(result)
+
+
+class SendQueueMiddleware(BaseRequestMiddleware):
+    def __init__(self, queue: SendQueue):
+        self.queue = queue
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ) -> TelegramType:
+        chat_id = getattr(method, 'chat_id', None)
+        if _in_worker.get() or not self.queue.running or chat_id is None:
+            return await make_request(bot, method)
+        priority = Priority.INTERACTIVE
+        if isinstance(method, (DeleteMessage, DeleteMessages)):
+            priority = Priority.BACKGROUND
+        return await self.queue.submit(lambda: make_request(bot, method), chat_id, priority)
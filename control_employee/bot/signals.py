@@ -0,0 +1,14 @@
+from django.db import connection
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from bot.geofence import GeofenceIndex
+from bot.models import Workplace
+
+
+@receiver(post_save, sender=Workplace)
+@receiver(post_delete, sender=Workplace)
+@receiver(m2m_changed, sender=Workplace.departments.through)
+def workplace_changed(**kwargs):
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT pg_notify(%s, %s)', [GeofenceIndex.channel, ''])
@@ -1,3 +1,145 @@
-from django.test import TestCase
+import datetime
+import unittest
 
-# Create your tests here.
+from aiogram.fsm.storage.base import StorageKey
+from django.db import IntegrityError, connection, transaction
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from bot.attendance import record_attendance, status_alert
+from bot.fsm import create_storage
+from bot.management.commands.bench_db_units import confirm_in_hops, confirm_in_unit, measure
+from bot.models import ActionLog, DailyAttendance, Department, TgUser, UserStatus
+from bot.partitions import Partition
+from bot.queries import DepartmentSnapshot, UserSnapshot, action_log_query, alert_candidates_query
+from bot.scheduler import Deadline
+
+try:
+    from fakeredis.aioredis import FakeRedis
+except ImportError:
+    FakeRedis = None
+
+
+DEPARTMENT_STATUS_INDEX = TgUser._meta.indexes[0].name
+
+
+class IndexUsageTests(TestCase):
+    # scaled down from production, but large enough for the planner to prefer an index over a seq scan
+    users_count = 5000
+    departments_count = 50
+    logged_users_count = 50
+    logs_per_user = 1000
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.departments = Department.objects.bulk_create(
+            [Department(name=f'Отдел {i}') for i in range(cls.departments_count)]
+        )
+        statuses = list(UserStatus)
+        cls.users = TgUser.objects.bulk_create([
+            TgUser(tg_id=i, department=cls.departments[i % cls.departments_count], status=statuses[i % len(statuses)])
+            for i in range(cls.users_count)
+        ])
+        # partitions are monthly, spread the rows over the first 28 days of the current one
+        cls.month_start = Partition.for_month(timezone.localdate()).start
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "INSERT INTO bot_actionlog (user_id, created, status_before, status_new) "
+                "SELECT u.id, %s + n * interval '40 minutes', %s, %s "
+                "FROM bot_tguser u CROSS JOIN generate_series(0, %s) n WHERE u.id = ANY(%s)",
+                [
+                    cls.month_start,
+                    UserStatus.NA.value,
+                    UserStatus.BEGIN.value,
+                    cls.logs_per_user - 1,
+                    [user.id for user in cls.users[:cls.logged_users_count]],
+                ],
+            )
+            cursor.execute('ANALYZE bot_tguser')
+            cursor.execute('ANALYZE bot_actionlog')
+
+    def test_report_uses_user_created_index(self):
+        day = self.month_start.date() + datetime.timedelta(days=1)
+        plan = action_log_query(self.users[0].id, day, day).explain()
+        self.assertRegex(plan, r'Index Cond: \(\(user_id = \d+\) AND \(created >=')
+
+    def test_alert_candidates_use_department_status_index(self):
+        department_ids = [department.id for department in self.departments[:3]]
+        for due in (
+            [(department_id, Deadline.begin) for department_id in department_ids],
+            [(department_id, Deadline.end_lanch) for department_id in department_ids],
+            [(department_ids[0], Deadline.begin), (department_ids[1], Deadline.end_lanch)],
+        ):
+            with self.subTest(due=due):
+                plan = alert_candidates_query(due).explain()
+                self.assertIn(DEPARTMENT_STATUS_INDEX, plan)
+
+    def test_tg_id_is_unique(self):
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            TgUser.objects.create(tg_id=self.users[0].tg_id)
+
+
+class StatusAlertTests(TestCase):
+    def setUp(self):
+        self.user = TgUser.objects.create(tg_id=1, first_name='Иван')
+
+    def log(self, status: UserStatus, hour: int) -> ActionLog:
+        action = ActionLog.objects.create(user=self.user, status_new=status)
+        action.created = timezone.localtime(action.created).replace(hour=hour, minute=30, second=0)
+        return action
+
+    def test_department_without_schedule_never_alerts(self):
+        department = Department.objects.create(name='Новый отдел')
+        snapshot = DepartmentSnapshot.from_model(department)
+        for status in (UserStatus.BEGIN, UserStatus.BEGIN_LANCH, UserStatus.END_LANCH, UserStatus.END):
+            with self.subTest(status=status):
+                action = self.log(status, 12)
+                self.assertIsNone(status_alert(UserSnapshot.from_model(self.user), snapshot, action))
+                record_attendance(action, snapshot)
+        self.assertTrue(DailyAttendance.objects.filter(user=self.user).exists())
+
+    def test_late_arrival_alerts(self):
+        department = Department.objects.create(name='Склад', begin=datetime.time(9))
+        snapshot = DepartmentSnapshot.from_model(department)
+        message = status_alert(UserSnapshot.from_model(self.user), snapshot, self.log(UserStatus.BEGIN, 10))
+        self.assertEqual(message, f'Сотрудник {self.user.name} Склад прибыл на рабочее место 10:30:00')
+
+
+@unittest.skipIf(FakeRedis is None, 'fakeredis is not installed')
+@override_settings(FSM_STORAGE='redis', FSM_STATE_TTL=600)
+class RedisStorageTests(SimpleTestCase):
+    key = StorageKey(bot_id=1, chat_id=555, user_id=555)
+
+    def setUp(self):
+        self.storage = create_storage()
+        self.storage.redis = FakeRedis()
+
+    async def test_state_and_data_round_trip(self):
+        await self.storage.set_state(self.key, 'DepartmentStateGroup:new_name')
+        await self.storage.update_data(self.key, {'old_name': 'Склад'})
+        self.assertEqual(await self.storage.get_state(self.key), 'DepartmentStateGroup:new_name')
+        self.assertEqual(await self.storage.get_data(self.key), {'old_name': 'Склад'})
+
+        await self.storage.set_state(self.key, None)
+        await self.storage.set_data(self.key, {})
+        self.assertIsNone(await self.storage.get_state(self.key))
+        self.assertEqual(await self.storage.get_data(self.key), {})
+
+    async def test_keys_expire_after_state_ttl(self):
+        await self.storage.set_state(self.key, 'DepartmentStateGroup:create')
+        ttl = await self.storage.redis.ttl(self.storage.key_builder.build(self.key, 'state'))
+        self.assertGreater(ttl, 0)
+        self.assertLessEqual(ttl, 600)
+
+
+class DbUnitConfirmationTests(TransactionTestCase):
+    # correctness of the bench_db_units variants; timings come from the management command
+    users_count = 20
+
+    async def test_both_variants_confirm_every_user(self):
+        users = await TgUser.objects.abulk_create([TgUser(tg_id=i) for i in range(self.users_count)])
+        for confirm in (confirm_in_hops, confirm_in_unit):
+            with self.subTest(confirm=confirm.__name__):
+                await measure(confirm, users, rounds=1)
+                self.assertFalse(await TgUser.objects.exclude(status=UserStatus.BEGIN).aexists())
+        self.assertEqual(await ActionLog.objects.acount(), 2 * self.users_count)
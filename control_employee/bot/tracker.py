@@ -0,0 +1,76 @@
+import asyncio
+import logging
+import typing
+from collections import OrderedDict, deque
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramAPIError
+from aiogram.methods import TelegramMethod
+from aiogram.methods.base import TelegramType
+from aiogram.types import Message
+
+logger = logging.getLogger(__name__)
+
+DELETE_BATCH_SIZE = 100
+
+
+class MessageTracker:
+    def __init__(self, size: int = 100, chats: int = 10000):
+        self.size = size
+        self.chats = chats
+        self._messages: typing.OrderedDict[int, typing.Deque[int]] = OrderedDict()
+        self._tasks = set()
+
+    def add(self, chat_id: int, message_id: int):
+        messages = self._messages.get(chat_id)
+        if messages is None:
+            messages = self._messages[chat_id] = deque(maxlen=self.size)
+            if len(self._messages) > self.chats:
+                self._messages.popitem(last=False)
+        else:
+            self._messages.move_to_end(chat_id)
+        if message_id not in messages:
+            messages.append(message_id)
+
+    def pop(self, chat_id: int, until: typing.Optional[int] = None, keep: typing.Optional[int] = None):
+        messages = self._messages.get(chat_id)
+        if not messages:
+            return []
+        popped = [m for m in messages if (until is None or m <= until) and m != keep]
+        if popped:
+            remaining = [m for m in messages if m not in popped]
+            messages.clear()
+            messages.extend(remaining)
+        return popped
+
+    def delete(self, bot: Bot, chat_id: int, message_ids: typing.List[int]):
+        if not message_ids:
+            return
+        task = asyncio.create_task(self._delete(bot, chat_id, message_ids))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _delete(self, bot: Bot, chat_id: int, message_ids: typing.List[int]):
+        for i in range(0, len(message_ids), DELETE_BATCH_SIZE):
+            try:
+                await bot.delete_messages(chat_id, message_ids[i:i + DELETE_BATCH_SIZE])
+            except TelegramAPIError as e:
+                logger.debug('Failed to delete messages in chat %s: %s', chat_id, e)
+
+
+class MessageTrackerMiddleware(BaseRequestMiddleware):
+    def __init__(self, tracker: MessageTracker):
+        self.tracker = tracker
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ) -> TelegramType:
+        result = await make_request(bot, method)
+        for message in result if isinstance(result, list) else (result,):
+            if isinstance(message, Message):
+                self.tracker.add(message.chat.id, message.message_id)
+        return result
@@ -0,0 +1,71 @@
+import asyncio
+import logging
+import signal
+
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+logger = logging.getLogger(__name__)
+
+
+class DrainingRequestHandler(SimpleRequestHandler):
+    @property
+    def in_flight(self) -> int:
+        return len(self._background_feed_update_tasks)
+
+    async def drain(self, timeout: float):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        if self.in_flight:
+            logger.info('Waiting for %s updates in flight', self.in_flight)
+        while self._background_feed_update_tasks:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                pending = set(self._background_feed_update_tasks)
+                logger.warning('Cancelling %s updates still running after %s s', len(pending), timeout)
+                for task in pending:
+                    task.cancel()
+                await asyncio.gather(*pending, return_exceptions=True)
+                break
+            await asyncio.wait(set(self._background_feed_update_tasks), timeout=remaining)
+
+
+async def run_webhook(dispatcher: Dispatcher, bot: Bot):
+    if not settings.WEBHOOK_URL or not settings.WEBHOOK_SECRET:
+        raise ImproperlyConfigured('WEBHOOK_URL and WEBHOOK_SECRET are required when BOT_MODE is webhook')
+    app = web.Application()
+    handler = DrainingRequestHandler(
+        dispatcher=dispatcher,
+        bot=bot,
+        handle_in_background=True,
+        secret_token=settings.WEBHOOK_SECRET,
+    )
+    handler.register(app, path=settings.WEBHOOK_PATH)
+    setup_application(app, dispatcher, bot=bot)
+    runner = web.AppRunner(app, handle_signals=False)
+    await runner.setup()
+    site = web.TCPSite(runner, settings.WEBHOOK_HOST, settings.WEBHOOK_PORT)
+    await site.start()
+
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stopping.set)
+    try:
+        await bot.set_webhook(
+            settings.WEBHOOK_URL.rstrip('/') + settings.WEBHOOK_PATH,
+            secret_token=settings.WEBHOOK_SECRET,
+            allowed_updates=dispatcher.resolve_used_update_types(),
+        )
+        logger.info('Listening for updates on %s:%s%s', settings.WEBHOOK_HOST, settings.WEBHOOK_PORT,
+                    settings.WEBHOOK_PATH)
+        await stopping.wait()
+    finally:
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.remove_signal_handler(sig)
+        await site.stop()
+        await handler.drain(settings.WEBHOOK_DRAIN_TIMEOUT)
+        await runner.cleanup()
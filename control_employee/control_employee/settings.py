@@ -82,17 +82,31 @@ WSGI_APPLICATION = 'control_employee.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
+DB_POOL = env.bool('DB_POOL', True)
+
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql_psycopg2',
+        'ENGINE': 'django.db.backends.postgresql',
         'NAME': env('DB_NAME'),
         'USER': env('DB_USER'),
         'PASSWORD': env('DB_PASSWORD'),
         'HOST': env('DB_HOST'),
         'PORT': env('DB_PORT'),
+        'CONN_MAX_AGE': 0 if DB_POOL else env.int('DB_CONN_MAX_AGE', 600),
+        'CONN_HEALTH_CHECKS': env.bool('DB_CONN_HEALTH_CHECKS', True),
+        'OPTIONS': {},
     }
 }
 
+if DB_POOL:
+    DATABASES['default']['OPTIONS']['pool'] = {
+        'min_size': env.int('DB_POOL_MIN_SIZE', 2),
+        'max_size': env.int('DB_POOL_MAX_SIZE', 10),
+        'max_lifetime': env.float('DB_POOL_MAX_LIFETIME', 3600),
+        'max_idle': env.float('DB_POOL_MAX_IDLE', 600),
+        'timeout': env.float('DB_POOL_TIMEOUT', 30),
+    }
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -138,6 +152,35 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 TOKEN_BOT = env('TOKEN_BOT')
 
+USER_CACHE_TTL = env.int('USER_CACHE_TTL', 300)
+
+BOT_MODE = env.str('BOT_MODE', 'polling')
+WEBHOOK_URL = env.str('WEBHOOK_URL', None)
+WEBHOOK_PATH = env.str('WEBHOOK_PATH', '/webhook')
+WEBHOOK_SECRET = env.str('WEBHOOK_SECRET', None)
+WEBHOOK_HOST = env.str('WEBHOOK_HOST', '0.0.0.0')
+WEBHOOK_PORT = env.int('WEBHOOK_PORT', 8080)
+WEBHOOK_DRAIN_TIMEOUT = env.float('WEBHOOK_DRAIN_TIMEOUT', 30)
+
+MONITORING_LOCK_KEY = env.int('MONITORING_LOCK_KEY', 7301)
+MONITORING_SHARDS = env.int('MONITORING_SHARDS', 1)
+MONITORING_LEADER_INTERVAL = env.float('MONITORING_LEADER_INTERVAL', 2)
+
+DEDUPE_STORE = env.str('DEDUPE_STORE', 'memory')
+DEDUPE_WINDOW = env.float('DEDUPE_WINDOW', 600)
+DEDUPE_TAP_WINDOW = env.float('DEDUPE_TAP_WINDOW', 1.5)
+
+FSM_STORAGE = env.str('FSM_STORAGE', 'postgres')
+FSM_STATE_TTL = env.int('FSM_STATE_TTL', 86400)
+FSM_REDIS_URL = env.str('FSM_REDIS_URL', 'redis://localhost:6379/0')
+
+METRICS_HOST = env.str('METRICS_HOST', '0.0.0.0')
+METRICS_PORT = env.int('METRICS_PORT', 9100)
+
+ACTIONLOG_PARTITIONS_AHEAD = env.int('ACTIONLOG_PARTITIONS_AHEAD', 3)
+ACTIONLOG_RETENTION_MONTHS = env.int('ACTIONLOG_RETENTION_MONTHS', 0)
+ACTIONLOG_ARCHIVE_DIR = env.path('ACTIONLOG_ARCHIVE_DIR', BASE_DIR / 'archive')
+
 # WORK_CHAT_ID = -4577922429
 # DESTINATION_LATITUDE = 56.478530
 # DESTINATION_LONGITUDE = 84.979250
@@ -145,3 +188,4 @@ TOKEN_BOT = env('TOKEN_BOT')
 WORK_CHAT_ID = -4594276450
 DESTINATION_LATITUDE = 45.09150498886614
 DESTINATION_LONGITUDE = 39.01328350827073
+DESTINATION_RADIUS = 100
@@ -1,25 +1,46 @@
 import asyncio
 import datetime
+import functools
+import html
 import typing
 from enum import Enum
 
 from aiogram import Bot, Dispatcher, F, Router
 from aiogram.client.default import DefaultBotProperties
-from aiogram.enums import ParseMode
+from aiogram.enums import ChatAction, ParseMode
 from aiogram.exceptions import TelegramBadRequest
 from aiogram.filters import Command, CommandStart, StateFilter
 from aiogram.filters.callback_data import CallbackData
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.handlers import CallbackQueryHandler, MessageHandler
-from aiogram.types import (InlineKeyboardButton, InlineKeyboardMarkup,
+from aiogram.methods import SendMessage
+from aiogram.types import (CallbackQuery, InlineKeyboardButton, InlineKeyboardMarkup,
                            KeyboardButton, Message, ReplyKeyboardRemove, BotCommand)
-from asgiref.sync import sync_to_async
-from bot.models import ActionLog, Department, TgUser, UserStatus, UserType
+from bot.attendance import format_attendance, record_attendance, status_alert
+from bot.cache import UserCache
+from bot.callback_answer import EarlyCallbackAnswerMiddleware
+from bot.db import ConnectionMiddleware, close_connections, db_unit
+from bot.dedupe import DedupeMiddleware, MemoryDedupeStore, PostgresDedupeStore
+from bot.export import SpooledInputFile, export_action_log
+from bot.fsm import PostgresStorage, create_storage
+from bot.geofence import GeofenceIndex, WorkplaceSnapshot
+from bot.leader import LeaderElection
+from bot.metrics import (MONITORING_TICK_SECONDS, SEND_QUEUE_DEPTH, ApiMetricsMiddleware, HandlerNameMiddleware,
+                         MetricsMiddleware, run_metrics_server)
+from bot.models import ActionLog, DailyAttendance, Department, Outbox, TgUser, UserStatus, UserType
+from bot.outbox import OutboxDispatcher
+from bot.partitions import run_maintenance
+from bot.queries import (Page, UserSnapshot, action_log_query, get_alert_candidates, get_department_report,
+                         is_alert_candidate, paginate)
+from bot.registry import DepartmentRegistry
+from bot.scheduler import AttendanceScheduler, Deadline
+from bot.send_queue import SendQueue, SendQueueMiddleware
+from bot.tracker import MessageTracker, MessageTrackerMiddleware
+from bot.webhook import run_webhook
 from dateutil.relativedelta import relativedelta
 from django.conf import settings
 from django.utils import timezone
-from geopy.distance import geodesic
 
 form_router = Router()
 
@@ -28,7 +49,36 @@ commands = [
 ]
 
 bot = Bot(token=settings.TOKEN_BOT, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
-dp = Dispatcher()
+fsm_storage = create_storage()
+dp = Dispatcher(storage=fsm_storage)
+dp.update.outer_middleware(MetricsMiddleware())
+dp.update.outer_middleware(ConnectionMiddleware())
+dp.update.outer_middleware(DedupeMiddleware(
+    PostgresDedupeStore() if settings.DEDUPE_STORE == 'postgres' else MemoryDedupeStore(),
+    window=settings.DEDUPE_WINDOW,
+    tap_window=settings.DEDUPE_TAP_WINDOW,
+))
+dp.callback_query.middleware(EarlyCallbackAnswerMiddleware())
+dp.message.middleware(HandlerNameMiddleware())
+dp.callback_query.middleware(HandlerNameMiddleware())
+
+message_tracker = MessageTracker()
+bot.session.middleware(MessageTrackerMiddleware(message_tracker))
+
+send_queue = SendQueue()
+bot.session.middleware(SendQueueMiddleware(send_queue))
+bot.session.middleware(ApiMetricsMiddleware())
+SEND_QUEUE_DEPTH.set_function(lambda: send_queue.depth)
+
+outbox_dispatcher = OutboxDispatcher(bot, send_queue)
+
+user_cache = UserCache(ttl=settings.USER_CACHE_TTL)
+
+department_registry = DepartmentRegistry()
+
+geofence = GeofenceIndex(fallback=WorkplaceSnapshot(
+    None, 'Место работы', settings.DESTINATION_LATITUDE, settings.DESTINATION_LONGITUDE, settings.DESTINATION_RADIUS
+))
 
 
 class DepartmentStateGroup(StatesGroup):
@@ -49,6 +99,10 @@ class TransferAdmin(StatesGroup):
     add_admin_state = State()
 
 
+class ExportStateGroup(StatesGroup):
+    period = State()
+
+
 class DepartmentAction(str, Enum):
     list = 'list'
     rename = 'rename'
@@ -57,11 +111,17 @@ class DepartmentAction(str, Enum):
     set_work_time = 'set_work_time'
     create = 'create'
     back = 'back'
+    detail = 'detail'
+    employee = 'employee'
+    report = 'report'
 
 
 class DepartmentCallback(CallbackData, prefix="department"):
     action: DepartmentAction
     department_id: typing.Optional[int] = None
+    user_id: typing.Optional[int] = None
+    cursor: typing.Optional[int] = None
+    backward: bool = False
 
 
 class ReportAction(str, Enum):
@@ -69,11 +129,13 @@ class ReportAction(str, Enum):
     yesterday = 'yesterday'
     week = 'week'
     month = 'month'
+    export = 'export'
 
 
 class ReportCallback(CallbackData, prefix='report'):
     action: ReportAction
     user_id: typing.Optional[int] = None
+    department_id: typing.Optional[int] = None
 
 
 class EmployeeAction(str, Enum):
@@ -119,11 +181,16 @@ class UserAction(str, Enum):
 
     set_new_department = 'set_new_department'
 
+    detail_new = 'detail_new'
+    detail = 'detail'
+
 
 class UserCallback(CallbackData, prefix='user'):
     action: UserAction
     user_id: typing.Optional[int] = None
     department_id: typing.Optional[int] = None
+    cursor: typing.Optional[int] = None
+    backward: bool = False
 
 
 class WorkTimeAction(str, Enum):
@@ -212,13 +279,12 @@ INTERFACE = {
 }
 
 
-@sync_to_async
-def get_user(tg_id):
-    return TgUser.objects.filter(tg_id=tg_id).first()
+async def get_user(tg_id):
+    return await TgUser.objects.filter(tg_id=tg_id).afirst()
 
 
-@sync_to_async
-def get_or_create_user(tg_user):
+@db_unit
+def _get_or_create_user(tg_user):
     user, created = TgUser.objects.get_or_create(tg_id=tg_user.id)
     if created:
         if tg_user.username:
@@ -228,31 +294,75 @@ def get_or_create_user(tg_user):
         if tg_user.last_name:
             user.last_name = tg_user.last_name
         user.save()
+    return UserSnapshot.from_model(user)
+
+
+async def get_or_create_user(tg_user) -> UserSnapshot:
+    user = user_cache.get(tg_user.id)
+    if user is None:
+        user = await _get_or_create_user(tg_user)
+        user_cache.put(user)
     return user
 
 
-@sync_to_async
-def get_user_department(user_id):
-    return Department.objects.filter(tguser__id=user_id).first()
+async def clear_messages(bot, chat_id, message_id, only_previous: bool = True, keep: typing.Optional[int] = None):
+    message_ids = message_tracker.pop(chat_id, until=message_id if only_previous else None, keep=keep)
+    if message_id != keep and message_id not in message_ids:
+        message_ids.append(message_id)
+    message_tracker.delete(bot, chat_id, message_ids)
 
 
-async def clear_messages(bot, chat_id, message_id, only_previous: bool = True):
-    message_ids = []
-    if only_previous:
-        message_ids = list(range(message_id, message_id - 100, -1))
-    else:
-        message_ids = list(range(message_id + 50, message_id - 50, -1))
-    try:
-        await bot.delete_messages(
-            chat_id,
-            message_ids
+async def navigate(message: Message, text: str, reply_markup=None) -> Message:
+    if getattr(message, 'text', None) is not None and (
+        reply_markup is None or isinstance(reply_markup, InlineKeyboardMarkup)
+    ):
+        try:
+            await message.edit_text(text, reply_markup=reply_markup)
+        except TelegramBadRequest as e:
+            if 'message is not modified' in e.message:
+                return message
+        else:
+            return message
+    return await message.answer(text, reply_markup=reply_markup)
+
+
+class MenuHandler(CallbackQueryHandler):
+    shown_message_id = None
+
+    async def show(self, text: str, reply_markup=None) -> Message:
+        message = await navigate(self.message, text, reply_markup)
+        self.shown_message_id = message.message_id
+        return message
+
+    async def clear_messages(self, only_previous: bool = True):
+        await clear_messages(
+            self.bot, self.message.chat.id, self.message.message_id,
+            only_previous=only_previous, keep=self.shown_message_id
         )
-    except TelegramBadRequest:
-        pass
+
+
+def page_kb(page: Page, row_button, page_callback, back_button=None) -> InlineKeyboardMarkup:
+    inline_keyboard = [[row_button(row)] for row in page.rows]
+    navigation = []
+    if page.prev_cursor is not None:
+        navigation.append(InlineKeyboardButton(
+            text='«',
+            callback_data=page_callback(cursor=page.prev_cursor, backward=True).pack()
+        ))
+    if page.next_cursor is not None:
+        navigation.append(InlineKeyboardButton(
+            text='»',
+            callback_data=page_callback(cursor=page.next_cursor).pack()
+        ))
+    if navigation:
+        inline_keyboard.append(navigation)
+    if back_button:
+        inline_keyboard.append([back_button])
+    return InlineKeyboardMarkup(inline_keyboard=inline_keyboard)
 
 
 @form_router.callback_query(UserCallback.filter(F.action.in_(UserAction)))
-class UserHandler(CallbackQueryHandler):
+class UserHandler(MenuHandler):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.actions = {
@@ -276,19 +386,16 @@ class UserHandler(CallbackQueryHandler):
             callback_data=UserCallback(action=UserAction.no_new_users).pack()
         )
 
-    @sync_to_async
-    def get_new_users(self):
-        return list(TgUser.objects.filter(user_type=UserType.NEW.value).all())
+    async def get_new_users(self, cursor=None, backward=False):
+        return await paginate(TgUser.objects.filter(user_type=UserType.NEW.value), cursor, backward)
 
-    @sync_to_async
-    def delete_user(self, user_id):
-        TgUser.objects.filter(id=user_id).delete()
+    async def delete_user(self, user_id):
+        await TgUser.objects.filter(id=user_id).adelete()
+        user_cache.invalidate(user_id)
 
     async def set_user_type(self, user_id, user_type: UserType):
-        @sync_to_async
-        def set_type(user_id, user_type: UserType):
-            return TgUser.objects.filter(id=user_id).update(user_type=user_type.value)
-        await set_type(user_id, user_type)
+        await TgUser.objects.filter(id=user_id).aupdate(user_type=user_type.value)
+        user_cache.update(user_id, user_type=user_type.value)
 
     async def apply_employee(self, user_id):
         await self.set_user_type(user_id, UserType.EMPLOYEE)
@@ -302,142 +409,174 @@ class UserHandler(CallbackQueryHandler):
     async def decline(self, user_id):
         await self.set_user_type(user_id, UserType.DECLINED)
 
-    @sync_to_async
-    def get_users_by_type(self, user_type):
-        return list(TgUser.objects.filter(user_type=user_type.value).all())
+    async def get_users_by_type(self, user_type, cursor=None, backward=False):
+        return await paginate(TgUser.objects.filter(user_type=user_type.value), cursor, backward)
 
-    async def list_directors(self):
-        directors = await self.get_users_by_type(UserType.DIRECTOR)
-        if directors:
-            for director in directors:
-                director_kb = InlineKeyboardMarkup(inline_keyboard=[
-                    [InlineKeyboardButton(
-                        text='Удалить пользователя',
-                        callback_data=UserCallback(action=UserAction.delete, user_id=director.id).pack()
-                    )],
-                    [self.registered_users_back_button],
-                ])
-                await self.message.answer(f'{director.name}', reply_markup=director_kb)
+    async def list_users(self, callback_data: UserCallback, user_type: UserType, title, empty_text):
+        page = await self.get_users_by_type(user_type, callback_data.cursor, callback_data.backward)
+        if page.rows:
+            lines = [
+                f'{user.name} — {UserStatus(user.status).label}' if user_type is UserType.EMPLOYEE else user.name
+                for user in page.rows
+            ]
+            kb = page_kb(
+                page,
+                lambda user: InlineKeyboardButton(
+                    text=user.name or str(user.id),
+                    callback_data=UserCallback(
+                        action=UserAction.detail, user_id=user.id, cursor=page.rows[0].id - 1
+                    ).pack()
+                ),
+                functools.partial(UserCallback, action=callback_data.action),
+                self.registered_users_back_button,
+            )
+            await self.show('\n'.join([title, ''] + lines), reply_markup=kb)
         else:
-            director_kb = InlineKeyboardMarkup(
+            kb = InlineKeyboardMarkup(
                 inline_keyboard=[[self.registered_users_back_button]]
             )
-            await self.message.answer('Отсутствуют директоры', reply_markup=director_kb)
-
-    async def list_managers(self):
-        managers = await self.get_users_by_type(UserType.MANAGER)
-        if managers:
-            for manager in managers:
-                manager_kb = InlineKeyboardMarkup(inline_keyboard=[
-                    [InlineKeyboardButton(
-                        text='Удалить пользователя',
-                        callback_data=UserCallback(action=UserAction.delete, user_id=manager.id).pack()
-                    )],
-                    [InlineKeyboardButton(
-                        text='Изменить подразделение',
-                        callback_data=UserCallback(action=UserAction.change_department, user_id=manager.id).pack()
-                    )],
-                    [self.registered_users_back_button],
-                ])
-                await self.message.answer(f'{manager.name}', reply_markup=manager_kb)
+            await self.show(empty_text, reply_markup=kb)
+
+    async def list_directors(self, callback_data: UserCallback):
+        await self.list_users(callback_data, UserType.DIRECTOR, 'Директора', 'Отсутствуют директоры')
+
+    async def list_managers(self, callback_data: UserCallback):
+        await self.list_users(callback_data, UserType.MANAGER, 'Руководители', 'Отсутствуют руководители')
+
+    async def list_employees(self, callback_data: UserCallback):
+        await self.list_users(callback_data, UserType.EMPLOYEE, 'Сотрудники', 'Отсутствуют сотрудники')
+
+    async def list_new(self, callback_data: UserCallback):
+        page = await self.get_new_users(callback_data.cursor, callback_data.backward)
+        if page.rows:
+            kb = page_kb(
+                page,
+                lambda user: InlineKeyboardButton(
+                    text=user.name or str(user.id),
+                    callback_data=UserCallback(
+                        action=UserAction.detail_new, user_id=user.id, cursor=page.rows[0].id - 1
+                    ).pack()
+                ),
+                functools.partial(UserCallback, action=UserAction.list_new),
+                self.no_new_users_back_button,
+            )
+            await self.show('\n'.join(['Новые пользователи', ''] + [user.name for user in page.rows]), reply_markup=kb)
         else:
-            manager_kb = InlineKeyboardMarkup(
-                inline_keyboard=[[self.registered_users_back_button]]
+            kb = InlineKeyboardMarkup(
+                inline_keyboard=[[self.no_new_users_back_button]]
             )
-            await self.message.answer('Отсутствуют руководители', reply_markup=manager_kb)
+            await self.show('Отсутствуют новые пользователи', reply_markup=kb)
 
-    async def list_employees(self):
-        employees = await self.get_users_by_type(UserType.EMPLOYEE)
-        if employees:
-            for employee in employees:
-                manager_kb = InlineKeyboardMarkup(inline_keyboard=[
-                    [InlineKeyboardButton(
-                        text='Удалить пользователя',
-                        callback_data=UserCallback(action=UserAction.delete, user_id=employee.id).pack()
-                    )],
-                    [InlineKeyboardButton(
-                        text='Изменить подразделение',
-                        callback_data=UserCallback(action=UserAction.change_department, user_id=employee.id).pack()
-                    )],
-                    [self.registered_users_back_button],
-                ])
-                msg = f'{employee.name}\nТекущий статус: {UserStatus(employee.status).label}'
-                await self.message.answer(msg, reply_markup=manager_kb)
-        else:
-            manager_kb = InlineKeyboardMarkup(
-                inline_keyboard=[[self.registered_users_back_button]]
+    async def new_user_detail(self, callback_data: UserCallback):
+        new_user = await self.get_user(callback_data.user_id)
+        back_button = InlineKeyboardButton(
+            text='Назад',
+            callback_data=UserCallback(action=UserAction.list_new, cursor=callback_data.cursor).pack()
+        )
+        if not new_user:
+            await self.show(
+                'Пользователь не найден', reply_markup=InlineKeyboardMarkup(inline_keyboard=[[back_button]])
+            )
+            return
+        kb = InlineKeyboardMarkup(inline_keyboard=[
+            [InlineKeyboardButton(
+                text='Принять как сотрудника',
+                callback_data=UserCallback(action=UserAction.apply_employee, user_id=new_user.id).pack()
+            )],
+            [InlineKeyboardButton(
+                text='Принять как руководителя',
+                callback_data=UserCallback(action=UserAction.apply_manager, user_id=new_user.id).pack()
+            )],
+            [InlineKeyboardButton(
+                text='Принять как директора',
+                callback_data=UserCallback(action=UserAction.apply_director, user_id=new_user.id).pack()
+            )],
+            [InlineKeyboardButton(
+                text='Отказать в регистрации',
+                callback_data=UserCallback(action=UserAction.decline, user_id=new_user.id).pack()
+            )],
+            [back_button],
+        ])
+        await self.show(f'{new_user.name}', reply_markup=kb)
+
+    async def user_detail(self, callback_data: UserCallback):
+        user = await self.get_user(callback_data.user_id)
+        if not user:
+            kb = InlineKeyboardMarkup(inline_keyboard=[[self.registered_users_back_button]])
+            await self.show('Пользователь не найден', reply_markup=kb)
+            return
+        user_type = UserType(user.user_type)
+        list_action = {
+            UserType.DIRECTOR: UserAction.list_directors,
+            UserType.MANAGER: UserAction.list_managers,
+            UserType.EMPLOYEE: UserAction.list_employees,
+        }.get(user_type, UserAction.registered_users)
+        kb = InlineKeyboardMarkup(inline_keyboard=[
+            [InlineKeyboardButton(
+                text='Удалить пользователя',
+                callback_data=UserCallback(action=UserAction.delete, user_id=user.id).pack()
+            )],
+        ])
+        if user_type in (UserType.MANAGER, UserType.EMPLOYEE):
+            kb.inline_keyboard.append(
+                [InlineKeyboardButton(
+                    text='Изменить подразделение',
+                    callback_data=UserCallback(action=UserAction.change_department, user_id=user.id).pack()
+                )]
             )
-            await self.message.answer('Отсутствуют сотрудники', reply_markup=manager_kb)
+        kb.inline_keyboard.append(
+            [InlineKeyboardButton(
+                text='Назад',
+                callback_data=UserCallback(action=list_action, cursor=callback_data.cursor).pack()
+            )]
+        )
+        msg = f'{user.name}'
+        if user_type is UserType.EMPLOYEE:
+            msg = f'{user.name}\nТекущий статус: {UserStatus(user.status).label}'
+        await self.show(msg, reply_markup=kb)
 
     async def back(self):
-        await self.message.answer('Меню администратора', reply_markup=admin_menu_kb)
+        await self.show('Меню администратора', reply_markup=admin_menu_kb)
 
     async def registered_back(self):
-        await self.message.answer('Зарегистрированные пользователи', reply_markup=registered_menu_kb)
+        await self.show('Зарегистрированные пользователи', reply_markup=registered_menu_kb)
 
     async def no_new_users(self):
-        await self.message.answer('Меню администратора', reply_markup=admin_menu_kb)
+        await self.show('Меню администратора', reply_markup=admin_menu_kb)
 
-    @sync_to_async
-    def _list_departments(self):
-        return list(Department.objects.all())
+    async def _list_departments(self, cursor=None, backward=False):
+        return await paginate(Department.objects.all(), cursor, backward)
 
-    @sync_to_async
-    def get_department(self, department_id):
-        return Department.objects.filter(id=department_id).first()
+    async def get_user(self, user_id):
+        return await TgUser.objects.filter(id=user_id).afirst()
 
-    @sync_to_async
-    def get_user(self, user_id):
-        return TgUser.objects.filter(id=user_id).first()
-
-    @sync_to_async
-    def update_user_department(self, user_id, department_id):
-        return TgUser.objects.filter(id=user_id).update(department_id=department_id)
+    async def update_user_department(self, user_id, department_id):
+        result = await TgUser.objects.filter(id=user_id).aupdate(department_id=department_id)
+        user_cache.invalidate(user_id)
+        return result
 
     async def handle(self) -> typing.Any:
         callback_data = UserCallback.unpack(self.callback_data)
+        user_back_button = InlineKeyboardButton(
+            text='Назад',
+            callback_data=UserCallback(action=UserAction.detail, user_id=callback_data.user_id).pack()
+        )
         if callback_data.action is UserAction.list_new:
-            new_users = await self.get_new_users()
-            if new_users:
-                for new_user in new_users:
-                    kb = InlineKeyboardMarkup(inline_keyboard=[
-                        [InlineKeyboardButton(
-                            text='Принять как сотрудника',
-                            callback_data=UserCallback(action=UserAction.apply_employee, user_id=new_user.id).pack()
-                        )],
-                        [InlineKeyboardButton(
-                            text='Принять как руководителя',
-                            callback_data=UserCallback(action=UserAction.apply_manager, user_id=new_user.id).pack()
-                        )],
-                        [InlineKeyboardButton(
-                            text='Принять как директора',
-                            callback_data=UserCallback(action=UserAction.apply_director, user_id=new_user.id).pack()
-                        )],
-                        [InlineKeyboardButton(
-                            text='Отказать в регистрации',
-                            callback_data=UserCallback(action=UserAction.decline, user_id=new_user.id).pack()
-                        )],
-                        [self.registered_users_back_button],
-                    ])
-                    await self.message.answer(
-                        f'{new_user.name}',
-                        reply_markup=kb
-                    )
-            else:
-                kb = InlineKeyboardMarkup(
-                    inline_keyboard=[[self.no_new_users_back_button]]
-                )
-                await self.message.answer('Отсутствуют новые пользователи', reply_markup=kb)
+            await self.list_new(callback_data)
+        elif callback_data.action is UserAction.detail_new:
+            await self.new_user_detail(callback_data)
+        elif callback_data.action is UserAction.detail:
+            await self.user_detail(callback_data)
         elif callback_data.action is UserAction.delete:
-            user = await get_or_create_user(self.message.from_user)
+            user = await get_or_create_user(self.from_user)
             if not user.id == callback_data.user_id:
                 await self.delete_user(callback_data.user_id)
-                await self.message.answer('Меню администратора', reply_markup=admin_menu_kb)
+                await self.show('Меню администратора', reply_markup=admin_menu_kb)
             else:
                 kb = InlineKeyboardMarkup(
                     inline_keyboard=[[self.no_new_users_back_button]]
                 )
-                await self.message.answer('Нельзя удалить себя', reply_markup=kb)
+                await self.show('Нельзя удалить себя', reply_markup=kb)
         elif callback_data.action in (
             UserAction.apply_employee,
             UserAction.apply_manager,
@@ -454,208 +593,282 @@ class UserHandler(CallbackQueryHandler):
                     )]
                 ]
             )
-            await self.message.answer('Пользователь принят', reply_markup=reply_kb)
+            await self.show('Пользователь принят', reply_markup=reply_kb)
         elif callback_data.action is UserAction.registered_users:
-            await self.message.answer('Зарегистрированные пользователи', reply_markup=registered_menu_kb)
+            await self.show('Зарегистрированные пользователи', reply_markup=registered_menu_kb)
         elif callback_data.action in (
             UserAction.list_directors,
             UserAction.list_managers,
             UserAction.list_employees,
-            UserAction.no_new_users,
         ):
             action = self.actions.get(callback_data.action)
-            await action()
+            await action(callback_data)
+        elif callback_data.action is UserAction.no_new_users:
+            await self.no_new_users()
         elif callback_data.action is UserAction.change_department:
-            change_department_kb = InlineKeyboardMarkup(
-                inline_keyboard=[
-                    [
-                        InlineKeyboardButton(
-                            text=dp.name,
-                            callback_data=UserCallback(
-                                action=UserAction.set_new_department,
-                                department_id=dp.id,
-                                user_id=callback_data.user_id
-                            ).pack()
-                        )
-                    ]
-                    for dp in await self._list_departments()
-                ]
+            page = await self._list_departments(callback_data.cursor, callback_data.backward)
+            change_department_kb = page_kb(
+                page,
+                lambda dp: InlineKeyboardButton(
+                    text=dp.name,
+                    callback_data=UserCallback(
+                        action=UserAction.set_new_department,
+                        department_id=dp.id,
+                        user_id=callback_data.user_id
+                    ).pack()
+                ),
+                functools.partial(UserCallback, action=UserAction.change_department, user_id=callback_data.user_id),
+                user_back_button,
             )
-            await self.message.answer('Выберите подразделение', reply_markup=change_department_kb)
+            await self.show('Выберите подразделение', reply_markup=change_department_kb)
         elif callback_data.action is UserAction.set_new_department:
             user = await self.get_user(callback_data.user_id)
             result = await self.update_user_department(callback_data.user_id, callback_data.department_id)
             back_kb = InlineKeyboardMarkup(
-                inline_keyboard=[
-                    [InlineKeyboardButton(
-                        text='Назад',
-                        callback_data=UserCallback(action=UserAction.list_employees).pack()
-                    )]
-                ]
+                inline_keyboard=[[user_back_button]]
             )
             if result:
-                await self.message.answer(f'У пользователя {user.name} изменено подразделение', reply_markup=back_kb)
+                await self.show(f'У пользователя {user.name} изменено подразделение', reply_markup=back_kb)
             else:
-                await self.message.answer(
+                await self.show(
                     f'Не удалось изменить подразделение у пользователя {user.name}',
                     reply_markup=back_kb
                 )
         elif callback_data.action is UserAction.back:
             await self.back()
         elif callback_data.action is UserAction.set_new_status:
-            await self.message.answer('Отправьте геолокацию', reply_markup=user_location_kb)
+            await self.show('Отправьте геолокацию', reply_markup=user_location_kb)
         elif callback_data.action is UserAction.add_admin:
             await self.data['state'].set_state(TransferAdmin.add_admin_state)
-            await self.message.answer('Укажите username нового админа')
-        await clear_messages(self.bot, self.message.chat.id, self.message.message_id)
+            await self.show('Укажите username нового админа')
+        await self.clear_messages()
         return await super().handle()
 
 
 @form_router.callback_query(DepartmentCallback.filter(F.action.in_(DepartmentAction)))
-class DepartmentsUser(CallbackQueryHandler):
+class DepartmentsUser(MenuHandler):
 
-    @sync_to_async
-    def get_list_of_departments(self, user):
+    async def get_list_of_departments(self, user, cursor=None, backward=False):
         user_type = UserType(user.user_type)
+        qs = Department.objects.none()
         if user_type in (UserType.ADMIN, UserType.DIRECTOR):
             qs = Department.objects.all()
         elif user_type is UserType.MANAGER:
-            qs = Department.objects.filter(id=user.department_id).all()
-        return list(qs)
+            qs = Department.objects.filter(id=user.department_id)
+        return await paginate(qs, cursor, backward)
 
-    @sync_to_async
-    def get_employees_of_department(self, department_id):
-        return list(TgUser.objects.filter(department_id=department_id).all())
+    async def get_employees_of_department(self, department_id, cursor=None, backward=False):
+        return await paginate(TgUser.objects.filter(department_id=department_id), cursor, backward)
 
-    @sync_to_async
-    def get_department(self, department_id):
-        return Department.objects.filter(id=department_id).first()
+    async def get_department(self, department_id):
+        return department_registry.get(department_id)
 
-    @sync_to_async
-    def _delete_department(self, department_id):
-        return Department.objects.filter(id=department_id).delete()
+    async def get_employee(self, user_id):
+        return await TgUser.objects.filter(id=user_id).afirst()
 
-    async def send_departments_list(self):
+    async def _delete_department(self, department_id):
+        return await Department.objects.filter(id=department_id).adelete()
+
+    async def send_departments_list(self, callback_data: DepartmentCallback):
         user = await get_or_create_user(self.from_user)
         user_type = UserType(user.user_type)
-        departments = await self.get_list_of_departments(user)
-        admin_department_back_button = InlineKeyboardButton(
-            text='Назад',
-            callback_data=DepartmentCallback(action=DepartmentAction.back).pack()
-        )
+        page = await self.get_list_of_departments(user, callback_data.cursor, callback_data.backward)
+        back_button = None
+        if user_type is UserType.ADMIN:
+            back_button = InlineKeyboardButton(
+                text='Назад',
+                callback_data=DepartmentCallback(action=DepartmentAction.back).pack()
+            )
+        if page.rows:
+            department_kb = page_kb(
+                page,
+                lambda department: InlineKeyboardButton(
+                    text=department.name,
+                    callback_data=DepartmentCallback(
+                        action=DepartmentAction.detail,
+                        department_id=department.id,
+                        cursor=page.rows[0].id - 1
+                    ).pack()
+                ),
+                functools.partial(DepartmentCallback, action=DepartmentAction.list),
+                back_button,
+            )
+            msg = '\n'.join(['Подразделения', ''] + [department.name for department in page.rows])
+            await self.show(msg, reply_markup=department_kb)
+        else:
+            department_kb = InlineKeyboardMarkup(
+                inline_keyboard=[[back_button]] if back_button else []
+            )
+            await self.show('Отсутствуют подразделения', reply_markup=department_kb)
+
+    async def send_department(self, callback_data: DepartmentCallback):
+        user = await get_or_create_user(self.from_user)
+        user_type = UserType(user.user_type)
+        department = await self.get_department(callback_data.department_id)
         department_back_button = InlineKeyboardButton(
             text='Назад',
-            callback_data=DepartmentCallback(action=DepartmentAction.list).pack()
+            callback_data=DepartmentCallback(action=DepartmentAction.list, cursor=callback_data.cursor).pack()
         )
-        if departments:
-            for department in departments:
-                department_kb = InlineKeyboardMarkup(
-                    inline_keyboard=[
-                        [InlineKeyboardButton(
-                            text='Сотрудники',
-                            callback_data=DepartmentCallback(
-                                action=DepartmentAction.employees,
-                                department_id=department.id
-                            ).pack()
-                        )],
-                    ]
-                )
-                if user_type is UserType.ADMIN:
-                    department_kb.inline_keyboard.append(
-                        [InlineKeyboardButton(
-                            text='Установить рабочее время',
-                            callback_data=DepartmentCallback(
-                                action=DepartmentAction.set_work_time,
-                                department_id=department.id
-                            ).pack()
-                        )]
-                    )
-                    department_kb.inline_keyboard.append(
-                        [InlineKeyboardButton(
-                            text='Переименовать подразделение',
-                            callback_data=DepartmentCallback(
-                                action=DepartmentAction.rename,
-                                department_id=department.id
-                            ).pack()
-                        )]
-                    )
-                    department_kb.inline_keyboard.append(
-                        [InlineKeyboardButton(
-                            text='Удалить подразделение',
-                            callback_data=DepartmentCallback(
-                                action=DepartmentAction.delete,
-                                department_id=department.id
-                            ).pack()
-                        )]
-                    )
-                    department_kb.inline_keyboard.append(
-                        [admin_department_back_button]
-                    )
-                elif user_type is UserType.DIRECTOR:
-                    department_kb.inline_keyboard.append(
-                        [department_back_button]
-                    )
-                elif user_type is UserType.MANAGER:
-                    department_kb.inline_keyboard.append(
-                        [InlineKeyboardButton(
-                            text='Установить рабочее время',
-                            callback_data=DepartmentCallback(
-                                action=DepartmentAction.set_work_time,
-                                department_id=department.id
-                            ).pack()
-                        )]
-                    )
-                    department_kb.inline_keyboard.append(
-                        [department_back_button]
-                    )
-                await self.message.answer(f'{department.name}', reply_markup=department_kb)
-        else:
-            if user_type is UserType.ADMIN:
-                department_kb = InlineKeyboardMarkup(
-                    inline_keyboard=[[admin_department_back_button]]
-                )
-            elif user_type in (UserType.DIRECTOR, UserType.MANAGER):
-                department_kb = InlineKeyboardMarkup(
-                    inline_keyboard=[[department_back_button]]
-                )
-            await self.message.answer('Отсутствуют подразделения', reply_markup=department_kb)
+        if not department:
+            kb = InlineKeyboardMarkup(inline_keyboard=[[department_back_button]])
+            await self.show('Подразделение не найдено', reply_markup=kb)
+            return
+        department_kb = InlineKeyboardMarkup(
+            inline_keyboard=[
+                [InlineKeyboardButton(
+                    text='Сотрудники',
+                    callback_data=DepartmentCallback(
+                        action=DepartmentAction.employees,
+                        department_id=department.id
+                    ).pack()
+                )],
+                [InlineKeyboardButton(
+                    text='Отчет по подразделению',
+                    callback_data=DepartmentCallback(
+                        action=DepartmentAction.report,
+                        department_id=department.id
+                    ).pack()
+                )],
+            ]
+        )
+        if user_type in (UserType.ADMIN, UserType.MANAGER):
+            department_kb.inline_keyboard.append(
+                [InlineKeyboardButton(
+                    text='Установить рабочее время',
+                    callback_data=DepartmentCallback(
+                        action=DepartmentAction.set_work_time,
+                        department_id=department.id
+                    ).pack()
+                )]
+            )
+        if user_type is UserType.ADMIN:
+            department_kb.inline_keyboard.append(
+                [InlineKeyboardButton(
+                    text='Переименовать подразделение',
+                    callback_data=DepartmentCallback(
+                        action=DepartmentAction.rename,
+                        department_id=department.id
+                    ).pack()
+                )]
+            )
+            department_kb.inline_keyboard.append(
+                [InlineKeyboardButton(
+                    text='Удалить подразделение',
+                    callback_data=DepartmentCallback(
+                        action=DepartmentAction.delete,
+                        department_id=department.id
+                    ).pack()
+                )]
+            )
+        department_kb.inline_keyboard.append([department_back_button])
+        await self.show(f'{department.name}', reply_markup=department_kb)
 
-    async def send_employees_of_department(self, department_id):
-        department_employees = await self.get_employees_of_department(department_id)
+    async def send_employees_of_department(self, callback_data: DepartmentCallback):
+        department_id = callback_data.department_id
+        page = await self.get_employees_of_department(department_id, callback_data.cursor, callback_data.backward)
         department_back_button = InlineKeyboardButton(
             text='Назад',
-            callback_data=DepartmentCallback(action=DepartmentAction.list).pack()
+            callback_data=DepartmentCallback(action=DepartmentAction.detail, department_id=department_id).pack()
         )
-        if department_employees:
-            for employee in department_employees:
-                employee_kb = InlineKeyboardMarkup(
-                    inline_keyboard=[
-                        [InlineKeyboardButton(
-                            text='Отчет за сегодня',
-                            callback_data=ReportCallback(action=ReportAction.today, user_id=employee.id).pack()
-                        )],
-                        [InlineKeyboardButton(
-                            text='Отчет за вчера',
-                            callback_data=ReportCallback(action=ReportAction.yesterday, user_id=employee.id).pack()
-                        )],
-                        [InlineKeyboardButton(
-                            text='Отчет за 7 дней',
-                            callback_data=ReportCallback(action=ReportAction.week, user_id=employee.id).pack()
-                        )],
-                        [InlineKeyboardButton(
-                            text='Отчет за месяц',
-                            callback_data=ReportCallback(action=ReportAction.month, user_id=employee.id).pack()
-                        )],
-                        [department_back_button],
-                    ]
-                )
-                msg = f'{employee.name} {employee.id}'
-                await self.message.answer(msg, reply_markup=employee_kb)
+        if page.rows:
+            employee_kb = page_kb(
+                page,
+                lambda employee: InlineKeyboardButton(
+                    text=employee.name or str(employee.id),
+                    callback_data=DepartmentCallback(
+                        action=DepartmentAction.employee,
+                        department_id=department_id,
+                        user_id=employee.id,
+                        cursor=page.rows[0].id - 1
+                    ).pack()
+                ),
+                functools.partial(DepartmentCallback, action=DepartmentAction.employees, department_id=department_id),
+                department_back_button,
+            )
+            msg = '\n'.join(['Сотрудники', ''] + [f'{employee.name} {employee.id}' for employee in page.rows])
+            await self.show(msg, reply_markup=employee_kb)
         else:
             employee_kb = InlineKeyboardMarkup(
                 inline_keyboard=[[department_back_button]]
             )
-            await self.message.answer('Отсутствуют сотрудники', reply_markup=employee_kb)
+            await self.show('Отсутствуют сотрудники', reply_markup=employee_kb)
+
+    async def send_employee(self, callback_data: DepartmentCallback):
+        employee = await self.get_employee(callback_data.user_id)
+        employees_back_button = InlineKeyboardButton(
+            text='Назад',
+            callback_data=DepartmentCallback(
+                action=DepartmentAction.employees,
+                department_id=callback_data.department_id,
+                cursor=callback_data.cursor
+            ).pack()
+        )
+        if not employee:
+            kb = InlineKeyboardMarkup(inline_keyboard=[[employees_back_button]])
+            await self.show('Сотрудник не найден', reply_markup=kb)
+            return
+        employee_kb = InlineKeyboardMarkup(
+            inline_keyboard=[
+                [InlineKeyboardButton(
+                    text='Отчет за сегодня',
+                    callback_data=ReportCallback(action=ReportAction.today, user_id=employee.id).pack()
+                )],
+                [InlineKeyboardButton(
+                    text='Отчет за вчера',
+                    callback_data=ReportCallback(action=ReportAction.yesterday, user_id=employee.id).pack()
+                )],
+                [InlineKeyboardButton(
+                    text='Отчет за 7 дней',
+                    callback_data=ReportCallback(action=ReportAction.week, user_id=employee.id).pack()
+                )],
+                [InlineKeyboardButton(
+                    text='Отчет за месяц',
+                    callback_data=ReportCallback(action=ReportAction.month, user_id=employee.id).pack()
+                )],
+                [InlineKeyboardButton(
+                    text='Выгрузка в CSV',
+                    callback_data=ReportCallback(
+                        action=ReportAction.export,
+                        user_id=employee.id,
+                        department_id=employee.department_id
+                    ).pack()
+                )],
+                [employees_back_button],
+            ]
+        )
+        await self.show(f'{employee.name} {employee.id}', reply_markup=employee_kb)
+
+    async def send_department_report_menu(self, callback_data: DepartmentCallback):
+        department_id = callback_data.department_id
+        report_kb = InlineKeyboardMarkup(
+            inline_keyboard=[
+                [InlineKeyboardButton(
+                    text='Отчет за сегодня',
+                    callback_data=ReportCallback(action=ReportAction.today, department_id=department_id).pack()
+                )],
+                [InlineKeyboardButton(
+                    text='Отчет за вчера',
+                    callback_data=ReportCallback(action=ReportAction.yesterday, department_id=department_id).pack()
+                )],
+                [InlineKeyboardButton(
+                    text='Отчет за 7 дней',
+                    callback_data=ReportCallback(action=ReportAction.week, department_id=department_id).pack()
+                )],
+                [InlineKeyboardButton(
+                    text='Отчет за месяц',
+                    callback_data=ReportCallback(action=ReportAction.month, department_id=department_id).pack()
+                )],
+                [InlineKeyboardButton(
+                    text='Выгрузка в CSV',
+                    callback_data=ReportCallback(action=ReportAction.export, department_id=department_id).pack()
+                )],
+                [InlineKeyboardButton(
+                    text='Назад',
+                    callback_data=DepartmentCallback(action=DepartmentAction.detail, department_id=department_id).pack()
+                )],
+            ]
+        )
+        await self.show('Отчет по подразделению', reply_markup=report_kb)
 
     async def set_work_time(self, department_id):
         department = await self.get_department(department_id)
@@ -699,16 +912,18 @@ class DepartmentsUser(CallbackQueryHandler):
                 [InlineKeyboardButton(
                     text='Назад',
                     callback_data=DepartmentCallback(
-                        action=DepartmentAction.list,
+                        action=DepartmentAction.detail,
                         department_id=department.id
                     ).pack()
                 )],
             ]
         )
-        await self.message.answer(f'{department.name}', reply_markup=work_time_kb)
+        await self.show(f'{department.name}', reply_markup=work_time_kb)
 
     async def delete_department(self, department_id):
         await self._delete_department(department_id)
+        await department_registry.changed(department_id)
+        user_cache.clear()
         kb = InlineKeyboardMarkup(
             inline_keyboard=[
                 [InlineKeyboardButton(
@@ -717,28 +932,34 @@ class DepartmentsUser(CallbackQueryHandler):
                 )],
             ]
         )
-        await self.message.answer('Удалено подразделение', reply_markup=kb)
+        await self.show('Удалено подразделение', reply_markup=kb)
 
     async def rename_department(self, department_id):
         department = await self.get_department(department_id)
-        await self.message.answer('Введите новое название подразделения')
+        await self.show('Введите новое название подразделения')
         await self.data['state'].set_state(DepartmentStateGroup.old_name)
         await self.data['state'].update_data(old_name=department.name)
         await self.data['state'].set_state(DepartmentStateGroup.new_name)
 
     async def create_new_department(self):
-        await self.message.answer('Введите название нового подразделения')
+        await self.show('Введите название нового подразделения')
         await self.data['state'].set_state(DepartmentStateGroup.create)
 
     async def back(self):
-        await self.message.answer('Меню администратора', reply_markup=admin_menu_kb)
+        await self.show('Меню администратора', reply_markup=admin_menu_kb)
 
     async def handle(self) -> typing.Any:
         callback_data = DepartmentCallback.unpack(self.callback_data)
         if callback_data.action == DepartmentAction.list:
-            await self.send_departments_list()
+            await self.send_departments_list(callback_data)
+        elif callback_data.action == DepartmentAction.detail:
+            await self.send_department(callback_data)
         elif callback_data.action == DepartmentAction.employees:
-            await self.send_employees_of_department(callback_data.department_id)
+            await self.send_employees_of_department(callback_data)
+        elif callback_data.action == DepartmentAction.employee:
+            await self.send_employee(callback_data)
+        elif callback_data.action == DepartmentAction.report:
+            await self.send_department_report_menu(callback_data)
         elif callback_data.action == DepartmentAction.set_work_time:
             await self.set_work_time(callback_data.department_id)
         elif callback_data.action == DepartmentAction.delete:
@@ -749,15 +970,14 @@ class DepartmentsUser(CallbackQueryHandler):
             await self.create_new_department()
         elif callback_data.action is DepartmentAction.back:
             await self.back()
-        await clear_messages(self.bot, self.message.chat.id, self.message.message_id)
+        await self.clear_messages()
         return await super().handle()
 
 
 @form_router.callback_query(WorkTimeCallback.filter(F.action.in_(WorkTimeAction)))
-class WorkTimeHandler(CallbackQueryHandler):
-    @sync_to_async
-    def get_department(self, department_id):
-        return Department.objects.filter(id=department_id).first()
+class WorkTimeHandler(MenuHandler):
+    async def get_department(self, department_id):
+        return department_registry.get(department_id)
 
     async def handle(self) -> typing.Any:
         callback_data = WorkTimeCallback.unpack(self.callback_data)
@@ -780,39 +1000,78 @@ class WorkTimeHandler(CallbackQueryHandler):
                 f'Конец обеда: {dp.end_lanch.strftime("%X")}\n'
                 f'Конец рабочего дня: {dp.end.strftime("%X")}'
             )
-            await self.message.answer(msg, reply_markup=kb)
+            await self.show(msg, reply_markup=kb)
         if callback_data.action == WorkTimeAction.set_begin:
             await self.data['state'].update_data(department_id=dp.id)
             await self.data['state'].set_state(WorkTimeStateGroup.set_begin)
-            await self.message.answer('Установите начало рабочего дня в формате чч мм')
+            await self.show('Установите начало рабочего дня в формате чч мм')
         if callback_data.action == WorkTimeAction.set_begin_lanch:
             await self.data['state'].update_data(department_id=dp.id)
             await self.data['state'].set_state(WorkTimeStateGroup.set_begin_lanch)
-            await self.message.answer('Установите начало обеда в формате чч мм')
+            await self.show('Установите начало обеда в формате чч мм')
         if callback_data.action == WorkTimeAction.set_end_lanch:
             await self.data['state'].update_data(department_id=dp.id)
             await self.data['state'].set_state(WorkTimeStateGroup.set_end_lanch)
-            await self.message.answer('Установите окончание обеда в формате чч мм')
+            await self.show('Установите окончание обеда в формате чч мм')
         if callback_data.action == WorkTimeAction.set_end:
             await self.data['state'].update_data(department_id=dp.id)
             await self.data['state'].set_state(WorkTimeStateGroup.set_end)
-            await self.message.answer('Установите окончание рабочего дня в формате чч мм')
-        await clear_messages(self.bot, self.message.chat.id, self.message.message_id)
+            await self.show('Установите окончание рабочего дня в формате чч мм')
+        await self.clear_messages()
         return await super().handle()
 
 
-@form_router.callback_query(ReportCallback.filter(F.action.in_(ReportAction)))
-class ReportHandler(CallbackQueryHandler):
-    @sync_to_async
-    def get_report_by_dates(self, user_id, from_date, to_date):
-        return list(ActionLog.objects.filter(created__date__gte=from_date, created__date__lte=to_date, user_id=user_id))
+REPORT_NAME_WIDTH = 18
+REPORT_MAX_ROWS = 80
 
-    @sync_to_async
-    def get_user(self, user_id):
-        return TgUser.objects.filter(id=user_id).first()
+
+@form_router.callback_query(ReportCallback.filter(F.action.in_(ReportAction)))
+class ReportHandler(MenuHandler):
+    async def get_report_by_dates(self, user_id, from_date, to_date):
+        qs = action_log_query(user_id, from_date, to_date)
+        return [
+            '\n'.join((timezone.localtime(r.created).strftime('%d.%m.%Y %X'), UserStatus(r.status_new).label))
+            async for r in qs.aiterator()
+        ]
+
+    async def get_attendance_by_dates(self, user_id, from_date, to_date):
+        qs = DailyAttendance.objects.filter(user_id=user_id, date__gte=from_date, date__lte=to_date).order_by('date')
+        return [format_attendance(attendance) async for attendance in qs]
+
+    async def get_user(self, user_id):
+        return await TgUser.objects.filter(id=user_id).afirst()
+
+    async def get_department_report(self, department_id, from_date, to_date):
+        rows = await get_department_report(department_id, from_date, to_date)
+        if not rows:
+            return 'В подразделении нет сотрудников'
+        lines = [f'{"Сотрудник":<{REPORT_NAME_WIDTH}} {"Дни":>3} {"Опозд":>5} {"Часы":>6}']
+        for row in rows[:REPORT_MAX_ROWS]:
+            name = row.name.strip()[:REPORT_NAME_WIDTH]
+            lines.append(f'{name:<{REPORT_NAME_WIDTH}} {row.days:>3} {row.late:>5} {row.minutes / 60:>6.1f}')
+        if len(rows) > REPORT_MAX_ROWS:
+            lines.append(f'... еще {len(rows) - REPORT_MAX_ROWS}')
+        total_minutes = sum(row.minutes for row in rows)
+        lines.append(
+            f'{"Итого":<{REPORT_NAME_WIDTH}} {sum(row.days for row in rows):>3} '
+            f'{sum(row.late for row in rows):>5} {total_minutes / 60:>6.1f}'
+        )
+        period = from_date.strftime('%d.%m.%Y')
+        if to_date != from_date:
+            period += ' - ' + to_date.strftime('%d.%m.%Y')
+        return f'Отчет за {period}\n<pre>{html.escape(chr(10).join(lines))}</pre>'
 
     async def handle(self) -> typing.Any:
         callback_data = ReportCallback.unpack(self.callback_data)
+        if callback_data.action is ReportAction.export:
+            await self.data['state'].update_data(
+                user_id=callback_data.user_id,
+                department_id=callback_data.department_id
+            )
+            await self.data['state'].set_state(ExportStateGroup.period)
+            await self.show('Введите период в формате дд.мм.гггг - дд.мм.гггг')
+            await self.clear_messages()
+            return await super().handle()
         if callback_data.action is ReportAction.today:
             to_date = timezone.localdate()
             from_date = timezone.localdate()
@@ -825,11 +1084,28 @@ class ReportHandler(CallbackQueryHandler):
         elif callback_data.action is ReportAction.month:
             to_date = timezone.localdate()
             from_date = timezone.localdate() - relativedelta(months=1)
-        report = await self.get_report_by_dates(callback_data.user_id, from_date, to_date)
-        msg = '\n\n'.join(
-            ['\n'.join((timezone.localtime(r.created).strftime('%d.%m.%Y %X'), UserStatus(r.status_new).label)) for r in report]
-        )
-        department = await get_user_department(callback_data.user_id)
+        if callback_data.user_id is None and callback_data.department_id is not None:
+            msg = await self.get_department_report(callback_data.department_id, from_date, to_date)
+            back_kb = InlineKeyboardMarkup(
+                inline_keyboard=[
+                    [InlineKeyboardButton(
+                        text='Назад',
+                        callback_data=DepartmentCallback(
+                            action=DepartmentAction.report,
+                            department_id=callback_data.department_id
+                        ).pack()
+                    )]
+                ]
+            )
+            await self.show(msg, reply_markup=back_kb)
+            await self.clear_messages(only_previous=False)
+            return await super().handle()
+        if callback_data.action in (ReportAction.week, ReportAction.month):
+            report = await self.get_attendance_by_dates(callback_data.user_id, from_date, to_date)
+        else:
+            report = await self.get_report_by_dates(callback_data.user_id, from_date, to_date)
+        msg = '\n\n'.join(report)
+        user = await self.get_user(callback_data.user_id)
         if not msg.strip():
             msg = 'Отсутствуют данные за указанный промежуток времени'
         back_kb = InlineKeyboardMarkup(
@@ -837,23 +1113,40 @@ class ReportHandler(CallbackQueryHandler):
                 [InlineKeyboardButton(
                     text='Назад',
                     callback_data=DepartmentCallback(
-                        action=DepartmentAction.employees,
-                        department_id=department.id
+                        action=DepartmentAction.employee,
+                        department_id=user.department_id if user else None,
+                        user_id=callback_data.user_id
                     ).pack()
                 )]
             ]
         )
-        await clear_messages(self.bot, self.message.chat.id, self.message.message_id, only_previous=False)
-        await self.message.answer(msg, reply_markup=back_kb)
+        await self.show(msg, reply_markup=back_kb)
+        await self.clear_messages(only_previous=False)
         return await super().handle()
 
 
+STATUS_FLOW = {
+    UserStatus.NA: (UserStatus.BEGIN,),
+    UserStatus.END: (UserStatus.BEGIN,),
+    UserStatus.BEGIN: (UserStatus.BEGIN_LANCH, UserStatus.END),
+    UserStatus.BEGIN_LANCH: (UserStatus.END_LANCH, UserStatus.END),
+    UserStatus.END_LANCH: (UserStatus.END,),
+}
+
+
 @form_router.callback_query(EmployeeCallback.filter(F.action.in_(EmployeeAction)))
-class UpdateStatusEmployee(CallbackQueryHandler):
-    @sync_to_async
-    def update_user_status(self, user_id, prev_status: UserStatus, status: UserStatus):
-        TgUser.objects.filter(id=user_id).update(status=status)
-        action = ActionLog.objects.create(user_id=user_id, status_before=prev_status.value, status_new=status.value)
+class UpdateStatusEmployee(MenuHandler):
+    @db_unit
+    def update_user_status(self, user: UserSnapshot, department, prev_status: UserStatus, status: UserStatus):
+        if status not in STATUS_FLOW.get(prev_status, ()):
+            return None
+        if not TgUser.objects.filter(id=user.id, status=prev_status).update(status=status):
+            return None
+        action = ActionLog.objects.create(user_id=user.id, status_before=prev_status.value, status_new=status.value)
+        record_attendance(action, department)
+        msg = status_alert(user, department, action)
+        if msg:
+            Outbox.objects.create(chat_id=settings.WORK_CHAT_ID, text=msg)
         return action
 
     async def handle(self) -> typing.Any:
@@ -881,54 +1174,31 @@ class UpdateStatusEmployee(CallbackQueryHandler):
                     ),
                 ]]
             )
-            await self.message.answer(
-                f'Ваш текущий статус - {callback_data.prev_status.label}.\nСменить статус на {callback_data.new_status.label}?',
+            await self.show(
+                f'Ваш текущий статус - {callback_data.prev_status.label}.\n'
+                f'Сменить статус на {callback_data.new_status.label}?',
                 reply_markup=confirm_yes_no_kb
             )
         elif callback_data.action is EmployeeAction.confirm_yes:
+            user = await get_or_create_user(self.from_user)
             action = await self.update_user_status(
-                callback_data.user_id, callback_data.prev_status, callback_data.new_status
+                user, department_registry.get(user.department_id), callback_data.prev_status, callback_data.new_status
             )
-            user = await get_or_create_user(self.from_user)
-            department = await get_user_department(user.id)
             if action:
-                action_created = timezone.localtime(action.created)
-                msg = None
-                new_status = UserStatus(action.status_new)
-                if new_status is UserStatus.BEGIN and department and action_created.time() > department.begin:
-                    msg = (
-                        f'Сотрудник {user.name} {department.name} прибыл на рабочее место '
-                        f'{action_created.time().strftime("%X")}'
-                    )
-                elif (
-                    new_status is UserStatus.BEGIN_LANCH
-                    and department and not (department.begin_lanch <= action_created.time() <= department.end_lanch)
-                ):
-                    msg = (
-                        f'Сотрудник {user.name} {department.name} ушел на обед '
-                        f'{action_created.time().strftime("%X")}'
-                    )
-                elif new_status is UserStatus.END_LANCH and department and action_created.time() > department.end_lanch:
-                    msg = (
-                        f'Сотрудник {user.name} {department.name} вернулся с обеда '
-                        f'{action_created.time().strftime("%X")}'
-                    )
-                elif new_status is UserStatus.END and department and action_created.time() < department.end:
-                    msg = (
-                        f'Сотрудник {user.name} {department.name} ушел с работы до окончания рабочего дня '
-                        f'{action_created.time().strftime("%X")}'
-                    )
-                if msg:
-                    try:
-                        await self.bot.send_message(settings.WORK_CHAT_ID, msg)
-                    except TelegramBadRequest:
-                        pass
+                user_cache.update(user.id, status=callback_data.new_status.value)
+                outbox_dispatcher.wake()
+                user = user._replace(status=callback_data.new_status.value)
+            else:
+                user_cache.invalidate(user.id)
+                user = await get_or_create_user(self.from_user)
             interface = INTERFACE.get(UserType.EMPLOYEE)
             menu_name, menu_kb = interface
             if UserType(user.user_type) is UserType.EMPLOYEE:
                 user_status = UserStatus(user.status)
                 menu_name = f'Текущий статус: {user_status.label}'
-            await self.message.answer(menu_name, reply_markup=menu_kb)
+                if not action:
+                    menu_name = f'Статус не изменен. {menu_name}'
+            await self.show(menu_name, reply_markup=menu_kb)
         elif callback_data.action is EmployeeAction.confirm_no:
             user = await get_or_create_user(self.from_user)
             interface = INTERFACE.get(UserType.EMPLOYEE)
@@ -936,8 +1206,8 @@ class UpdateStatusEmployee(CallbackQueryHandler):
             if UserType(user.user_type) is UserType.EMPLOYEE:
                 user_status = UserStatus(user.status)
                 menu_name = f'Текущий статус: {user_status.label}'
-            await self.message.answer(menu_name, reply_markup=menu_kb)
-        await clear_messages(self.bot, self.message.chat.id, self.message.message_id)
+            await self.show(menu_name, reply_markup=menu_kb)
+        await self.clear_messages()
         return await super().handle()
 
 
@@ -946,27 +1216,16 @@ class LocationMessageHandler(MessageHandler):
 
     async def handle(self) -> typing.Any:
         await self.data['state'].clear()
-        distance_m = geodesic(
-            (settings.DESTINATION_LATITUDE, settings.DESTINATION_LONGITUDE),
-            (self.event.location.latitude, self.event.location.longitude)
-        ).m
-        if distance_m > 100:
+        user = await get_or_create_user(self.from_user)
+        if not geofence.find(self.event.location.latitude, self.event.location.longitude, user.department_id):
             msg = (
                 'Ваше место положение не совпадает с местом работы.\n'
                 'Пожалуйста вернитесь на место работы и попробуйте еще раз.'
             )
             await self.event.answer(msg, reply_markup=user_kb)
         else:
-            user = await get_or_create_user(self.from_user)
-            status_flow = {
-                UserStatus.NA: (UserStatus.BEGIN,),
-                UserStatus.END: (UserStatus.BEGIN,),
-                UserStatus.BEGIN: (UserStatus.BEGIN_LANCH, UserStatus.END),
-                UserStatus.BEGIN_LANCH: (UserStatus.END_LANCH, UserStatus.END),
-                UserStatus.END_LANCH: (UserStatus.END,),
-            }
             user_status = UserStatus(user.status)
-            c_data = status_flow.get(user_status)
+            c_data = STATUS_FLOW.get(user_status)
             user_next_status_kb = InlineKeyboardMarkup(
                 inline_keyboard=[
                     [
@@ -989,9 +1248,8 @@ class LocationMessageHandler(MessageHandler):
 
 @form_router.message(WorkTimeStateGroup.set_begin)
 class WorkTimeBegin(MessageHandler):
-    @sync_to_async
-    def set_begin(self, department_id, time):
-        Department.objects.filter(id=department_id).update(begin=time)
+    async def set_begin(self, department_id, time):
+        await Department.objects.filter(id=department_id).aupdate(begin=time)
 
     async def handle(self) -> typing.Any:
         _data = await self.data['state'].get_data()
@@ -1009,6 +1267,7 @@ class WorkTimeBegin(MessageHandler):
             await self.message.answer('Введите время в формате чч мм')
         else:
             await self.set_begin(department_id, begin_time)
+            await department_registry.changed(department_id)
             kb = InlineKeyboardMarkup(
                 inline_keyboard=[
                     [InlineKeyboardButton(
@@ -1026,9 +1285,8 @@ class WorkTimeBegin(MessageHandler):
 
 @form_router.message(WorkTimeStateGroup.set_begin_lanch)
 class WorkTimeBeginLanch(MessageHandler):
-    @sync_to_async
-    def set_begin_lanch(self, department_id, time):
-        Department.objects.filter(id=department_id).update(begin_lanch=time)
+    async def set_begin_lanch(self, department_id, time):
+        await Department.objects.filter(id=department_id).aupdate(begin_lanch=time)
 
     async def handle(self) -> typing.Any:
         _data = await self.data['state'].get_data()
@@ -1046,6 +1304,7 @@ class WorkTimeBeginLanch(MessageHandler):
             await self.message.answer('Введите время в формате чч мм')
         else:
             await self.set_begin_lanch(department_id, begin_time)
+            await department_registry.changed(department_id)
             kb = InlineKeyboardMarkup(
                 inline_keyboard=[
                     [InlineKeyboardButton(
@@ -1063,9 +1322,8 @@ class WorkTimeBeginLanch(MessageHandler):
 
 @form_router.message(WorkTimeStateGroup.set_end_lanch)
 class WorkTimeEndLanch(MessageHandler):
-    @sync_to_async
-    def set_end_lanch(self, department_id, time):
-        Department.objects.filter(id=department_id).update(end_lanch=time)
+    async def set_end_lanch(self, department_id, time):
+        await Department.objects.filter(id=department_id).aupdate(end_lanch=time)
 
     async def handle(self) -> typing.Any:
         _data = await self.data['state'].get_data()
@@ -1083,6 +1341,7 @@ class WorkTimeEndLanch(MessageHandler):
             await self.message.answer('Введите время в формате чч мм')
         else:
             await self.set_end_lanch(department_id, begin_time)
+            await department_registry.changed(department_id)
             kb = InlineKeyboardMarkup(
                 inline_keyboard=[
                     [InlineKeyboardButton(
@@ -1100,9 +1359,8 @@ class WorkTimeEndLanch(MessageHandler):
 
 @form_router.message(WorkTimeStateGroup.set_end)
 class WorkTimeEnd(MessageHandler):
-    @sync_to_async
-    def set_end(self, department_id, time):
-        Department.objects.filter(id=department_id).update(end=time)
+    async def set_end(self, department_id, time):
+        await Department.objects.filter(id=department_id).aupdate(end=time)
 
     async def handle(self) -> typing.Any:
         _data = await self.data['state'].get_data()
@@ -1120,6 +1378,7 @@ class WorkTimeEnd(MessageHandler):
             await self.message.answer('Введите время в формате чч мм')
         else:
             await self.set_end(department_id, begin_time)
+            await department_registry.changed(department_id)
             kb = InlineKeyboardMarkup(
                 inline_keyboard=[
                     [InlineKeyboardButton(
@@ -1137,9 +1396,8 @@ class WorkTimeEnd(MessageHandler):
 
 @form_router.message(DepartmentStateGroup.new_name)
 class NewNameDepartment(MessageHandler):
-    @sync_to_async
-    def rename_department(self, old_name, new_name):
-        Department.objects.filter(name=old_name).update(name=new_name)
+    async def rename_department(self, old_name, new_name):
+        await Department.objects.filter(name=old_name).aupdate(name=new_name)
 
     async def handle(self) -> typing.Any:
         _data = await self.data['state'].get_data()
@@ -1147,6 +1405,7 @@ class NewNameDepartment(MessageHandler):
         old_name = _data['old_name']
         new_name = self.event.text
         await self.rename_department(old_name, new_name)
+        await department_registry.changed()
         kb = InlineKeyboardMarkup(
             inline_keyboard=[
                 [InlineKeyboardButton(
@@ -1161,14 +1420,14 @@ class NewNameDepartment(MessageHandler):
 
 @form_router.message(DepartmentStateGroup.create)
 class NewDepartment(MessageHandler):
-    @sync_to_async
-    def create_department(self, new_name):
-        Department.objects.create(name=new_name)
+    async def create_department(self, new_name):
+        await Department.objects.acreate(name=new_name)
 
     async def handle(self) -> typing.Any:
         await self.data['state'].set_state(None)
         new_name = self.event.text
         await self.create_department(new_name)
+        await department_registry.changed()
         kb = InlineKeyboardMarkup(
             inline_keyboard=[
                 [InlineKeyboardButton(
@@ -1181,14 +1440,62 @@ class NewDepartment(MessageHandler):
         return await super().handle()
 
 
-@sync_to_async
-def get_user_by_username(username):
-    return TgUser.objects.filter(username=username).first()
+def parse_period(text):
+    parts = [part.strip() for part in text.replace('—', '-').split('-')]
+    if len(parts) == 1:
+        parts = parts * 2
+    if len(parts) != 2:
+        raise ValueError(text)
+    from_date, to_date = (datetime.datetime.strptime(part, '%d.%m.%Y').date() for part in parts)
+    if from_date > to_date:
+        from_date, to_date = to_date, from_date
+    return from_date, to_date
+
+
+@form_router.message(ExportStateGroup.period)
+class ExportPeriodMessageHandler(MessageHandler):
+
+    async def handle(self) -> typing.Any:
+        _data = await self.data['state'].get_data()
+        await self.data['state'].set_state(None)
+        try:
+            from_date, to_date = parse_period(self.event.text or '')
+        except ValueError:
+            await self.event.answer('Введите период в формате дд.мм.гггг - дд.мм.гггг')
+            return await super().handle()
+        user_id = _data.get('user_id')
+        department_id = _data.get('department_id')
+        if user_id is not None:
+            back = DepartmentCallback(action=DepartmentAction.employee, department_id=department_id, user_id=user_id)
+        else:
+            back = DepartmentCallback(action=DepartmentAction.report, department_id=department_id)
+        kb = InlineKeyboardMarkup(
+            inline_keyboard=[[InlineKeyboardButton(text='Назад', callback_data=back.pack())]]
+        )
+        await self.bot.send_chat_action(self.event.chat.id, ChatAction.UPLOAD_DOCUMENT)
+        if user_id is not None:
+            export, count = await export_action_log(from_date, to_date, user_id=user_id)
+        else:
+            export, count = await export_action_log(from_date, to_date, department_id=department_id)
+        with export:
+            if not count:
+                await self.event.answer('Отсутствуют данные за указанный промежуток времени', reply_markup=kb)
+                return await super().handle()
+            filename = f'attendance_{from_date:%Y%m%d}_{to_date:%Y%m%d}.csv.gz'
+            await self.event.answer_document(
+                SpooledInputFile(export, filename),
+                caption=f'Записей: {count}',
+                reply_markup=kb
+            )
+        return await super().handle()
+
+
+async def get_user_by_username(username):
+    return await TgUser.objects.filter(username=username).afirst()
 
 
-@sync_to_async
-def transfer_admin(user_id):
-    TgUser.objects.filter(id=user_id).update(user_type=UserType.ADMIN.value)
+async def transfer_admin(user_id):
+    await TgUser.objects.filter(id=user_id).aupdate(user_type=UserType.ADMIN.value)
 
 
 @form_router.message(TransferAdmin.add_admin_state)
@@ -1205,6 +1512,7 @@ class TransferAdminMessageHandler(MessageHandler):
         )
         if new_user:
             await transfer_admin(new_user.id)
+            user_cache.update(new_user.id, user_type=UserType.ADMIN.value)
             await self.event.answer(f'Пользователь с ником {new_user.username} назначен админом', reply_markup=kb)
             await self.bot.send_message(new_user.tg_id, 'Вы назначены админом')
         else:
@@ -1237,49 +1545,100 @@ async def unknown_command(message: Message, state: FSMContext) -> None:
     await message.answer('Неизвестная команда.\nВоспользуйтесь главным меню - /menu')
 
 
+# buttons from old menus no longer match any filter above and would keep spinning
+@form_router.callback_query(flags={'callback_answer': {'disabled': True}})
+async def unknown_callback(callback_query: CallbackQuery) -> None:
+    try:
+        await callback_query.answer('Кнопка устарела.\nВоспользуйтесь главным меню - /menu')
+    except TelegramBadRequest:
+        pass
+
+
 async def run_bot():
     dp.include_router(form_router)
     await bot.set_my_commands(commands)
-    await dp.start_polling(bot)
+    if settings.BOT_MODE == 'webhook':
+        await run_webhook(dp, bot)
+    else:
+        await bot.delete_webhook()
+        await dp.start_polling(bot)
 
 
-@sync_to_async
-def get_users():
-    return list(TgUser.objects.all())
+monitoring_leader = LeaderElection(
+    settings.MONITORING_LOCK_KEY,
+    shards=settings.MONITORING_SHARDS,
+    interval=settings.MONITORING_LEADER_INTERVAL,
+)
+
+
+async def get_departments():
+    return [department for department in department_registry.all() if monitoring_leader.owns(department.id)]
+
+
+ALERT_MESSAGES = {
+    Deadline.begin: 'Сотрудник {user.name} {department.name} не на рабочем месте',
+    Deadline.end_lanch: 'Сотрудник {user.name} {department.name} еще не вернулся с обеда',
+}
+
+
+async def check_deadlines(due):
+    if not (bot.session._session and not bot.session._session.closed):
+        return
+    with MONITORING_TICK_SECONDS.time():
+        await send_alerts(due)
+    await close_connections()
+
+
+async def send_alerts(due):
+    deadlines = {}
+    departments = {}
+    for department, deadline in due:
+        deadlines.setdefault(department.id, []).append(deadline)
+        departments[department.id] = department
+    for user in await get_alert_candidates((department.id, deadline) for department, deadline in due):
+        for deadline in deadlines[user.department_id]:
+            if is_alert_candidate(UserStatus(user.status), deadline):
+                msg = ALERT_MESSAGES[deadline].format(user=user, department=departments[user.department_id])
+                send_queue.send(bot, SendMessage(chat_id=settings.WORK_CHAT_ID, text=msg))
+                break
+
+
+scheduler = AttendanceScheduler(get_departments, check_deadlines)
+department_registry.subscribe(scheduler.rebuild)
+monitoring_leader.subscribe(scheduler.rebuild)
 
 
 async def monitoring():
     print('Запуск мониторинга')
-    while True:
-        now = timezone.now().time()
-        if bot.session._session and not bot.session._session.closed:
-            for user in await get_users():
-                msg = None
-                department = await get_user_department(user.id)
-                if department:
-                    if (
-                        not UserStatus(user.status) is UserStatus.BEGIN
-                        and (department.begin.hour == now.hour and department.begin.minute == now.minute)
-                    ):
-                        msg = f'Сотрудник {user.name} {department.name} не на рабочем месте'
-                    elif (
-                        UserStatus(user.status) is UserStatus.BEGIN_LANCH
-                        and (department.end_lanch.hour == now.hour and department.end_lanch.minute == now.minute)
-                    ):
-                        msg = f'Сотрудник {user.name} {department.name} еще не вернулся с обеда'
-                    if msg:
-                        try:
-                            await bot.send_message(settings.WORK_CHAT_ID, msg)
-                        except TelegramBadRequest:
-                            pass
-        await asyncio.sleep(60)
+    await asyncio.gather(monitoring_leader.run(), scheduler.run())
 
 
 async def main() -> None:
-    await asyncio.gather(
-        run_bot(),
-        monitoring(),
-    )
+    send_queue.start()
+    await department_registry.load()
+    await geofence.load()
+    tasks = [
+        asyncio.create_task(monitoring()),
+        asyncio.create_task(department_registry.listen()),
+        asyncio.create_task(geofence.listen()),
+        asyncio.create_task(outbox_dispatcher.run()),
+        asyncio.create_task(run_maintenance(
+            settings.ACTIONLOG_PARTITIONS_AHEAD,
+            settings.ACTIONLOG_RETENTION_MONTHS,
+            str(settings.ACTIONLOG_ARCHIVE_DIR),
+        )),
+    ]
+    if isinstance(fsm_storage, PostgresStorage):
+        tasks.append(asyncio.create_task(fsm_storage.run()))
+    if settings.METRICS_PORT:
+        tasks.append(asyncio.create_task(run_metrics_server(settings.METRICS_HOST, settings.METRICS_PORT)))
+    try:
+        await run_bot()
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await send_queue.stop()
 
 
 def run(*args):